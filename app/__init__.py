@@ -146,10 +146,21 @@ def create_app():
         return response
 
     db.init_app(app)
+    from app.cache import cache
+    cache.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app)
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue and message_queue.startswith(('redis://', 'rediss://')):
+        try:
+            import redis  # noqa: F401
+        except ImportError:
+            app.logger.warning('SOCKETIO_MESSAGE_QUEUE is set but the redis package is not installed; emits stay within this worker.')
+            message_queue = None
+    socketio.init_app(app, message_queue=message_queue, channel=app.config.get('SOCKETIO_CHANNEL', 'excellence-socketio'))
+    from app.events import outbound
+    outbound.init_app(app)
     mail.init_app(app)
 
     from app.models import User, create_admin_from_env
@@ -165,4 +176,11 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix="/admin")
     app.register_blueprint(main_bp)
 
+    # Register flask CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+
+    # Register Socket.IO event handlers
+    from app import sockets  # noqa: F401
+
     return app 
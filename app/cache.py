@@ -0,0 +1,192 @@
+"""
+Small TTL cache for expensive dashboard reads and shared counters.
+
+Values live in process memory unless CACHE_REDIS_URL is set, in which case they
+are shared by every worker through Redis (the redis package is then required).
+Writers call invalidate_on_commit() with the key prefixes their change affects,
+or on_commit() for other follow-up work; both run only once the transaction
+commits, so a rolled back change never evicts or announces anything.
+"""
+import pickle
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+class MemoryCache:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def add(self, key, value, timeout=None):
+        """Set `key` only if it is not cached; returns True if it was set"""
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] >= time.monotonic()):
+                return False
+            self._data[key] = (value, expires_at)
+            return True
+
+    def incr(self, key, delta=1):
+        """Add `delta` to a cached integer and return the new value; returns None if the key is not cached"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+                return None
+            value = entry[0] + delta
+            self._data[key] = (value, entry[1])
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+class RedisCache:
+    """Same interface as MemoryCache, backed by Redis. Integers are stored as plain numbers so incr() works."""
+
+    # INCRBY only when the key exists, so a missing counter is recomputed rather than started from zero
+    _INCR_IF_EXISTS = "if redis.call('exists', KEYS[1]) == 1 then return redis.call('incrby', KEYS[1], ARGV[1]) end"
+
+    def __init__(self, client, prefix='excellence:'):
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        if raw is None:
+            return None
+        try:
+            return int(raw)
+        except ValueError:
+            return pickle.loads(raw)
+
+    def set(self, key, value, timeout=None):
+        raw = str(value) if isinstance(value, int) and not isinstance(value, bool) else pickle.dumps(value)
+        self._client.set(self._prefix + key, raw, ex=timeout or None)
+
+    def add(self, key, value, timeout=None):
+        raw = str(value) if isinstance(value, int) and not isinstance(value, bool) else pickle.dumps(value)
+        return bool(self._client.set(self._prefix + key, raw, ex=timeout or None, nx=True))
+
+    def incr(self, key, delta=1):
+        return self._client.eval(self._INCR_IF_EXISTS, 1, self._prefix + key, delta)
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def delete_prefix(self, prefix):
+        keys = list(self._client.scan_iter(match=self._prefix + prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+class Cache:
+    """Application cache; delegates to the memory or Redis backend chosen by init_app()"""
+
+    # Bumped by every delete; get_or_set() doesn't store a value built across a bump
+    GENERATION_KEY = 'cache:generation'
+
+    def __init__(self):
+        self.backend = MemoryCache()
+
+    def init_app(self, app):
+        url = app.config.get('CACHE_REDIS_URL')
+        if not url:
+            return
+        try:
+            import redis
+        except ImportError:
+            app.logger.warning('CACHE_REDIS_URL is set but the redis package is not installed; using the in-process cache.')
+            return
+        self.backend = RedisCache(redis.Redis.from_url(url))
+
+    def get_or_set(self, key, build, timeout=None, lock_timeout=10, poll_interval=0.05):
+        """
+        Return the cached value of `key`, calling `build()` to compute and cache it on a miss.
+
+        Single flight: one caller per key (across workers with Redis) holds a short lock
+        and builds; the others poll for its result instead of running the same query.
+        If the builder fails or takes longer than `lock_timeout`, a waiter builds itself.
+        A value whose build overlapped an invalidation is returned but not cached, since
+        it may have been read before the change that invalidated it.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+        lock_key = f'lock:{key}'
+        deadline = time.monotonic() + lock_timeout
+        while not self.backend.add(lock_key, 1, lock_timeout):
+            time.sleep(poll_interval)
+            value = self.backend.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                return build()
+        try:
+            generation = self.backend.get(self.GENERATION_KEY)
+            value = build()
+            if self.backend.get(self.GENERATION_KEY) == generation:
+                self.backend.set(key, value, timeout)
+            return value
+        finally:
+            self.backend.delete(lock_key)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self._bump_generation()
+
+    def delete_prefix(self, prefix):
+        self.backend.delete_prefix(prefix)
+        self._bump_generation()
+
+    def _bump_generation(self):
+        if self.backend.incr(self.GENERATION_KEY) is None:
+            self.backend.add(self.GENERATION_KEY, 1)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+cache = Cache()
+
+def invalidate_on_commit(*prefixes):
+    """Drop every cache key starting with one of `prefixes` when the current transaction commits"""
+    from app import db
+    db.session.info.setdefault('cache_invalidations', set()).update(prefixes)
+
+def on_commit(callback):
+    """Call `callback()` once the current transaction commits (after the invalidations); SQL can't be run there"""
+    from app import db
+    db.session.info.setdefault('commit_callbacks', []).append(callback)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    for prefix in session.info.pop('cache_invalidations', ()):
+        cache.delete_prefix(prefix)
+    for callback in session.info.pop('commit_callbacks', ()):
+        callback()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('cache_invalidations', None)
+    session.info.pop('commit_callbacks', None)
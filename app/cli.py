@@ -0,0 +1,74 @@
+import sys
+import time
+import click
+from app import db
+from app.models import StudentBalance, Fee, User, month_label_to_period
+from app.utils import refresh_student_balances, iter_fee_ledger_csv
+
+def register_commands(app):
+    @app.cli.command('rebuild-balances')
+    @click.option('--check', is_flag=True, help='Only report drift, do not rewrite the table.')
+    def rebuild_balances(check):
+        """Rebuild the student_balances table from the fees table and report drift."""
+        unpaid = Fee.is_paid.is_not(True)
+        expected = db.session.query(
+            User.id,
+            db.func.count(Fee.id).filter(unpaid),
+            db.func.coalesce(db.func.sum(Fee.amount_due).filter(unpaid), 0),
+            db.func.coalesce(db.func.sum(Fee.amount_due).filter(Fee.is_paid == True), 0)
+        ).outerjoin(Fee, Fee.user_id == User.id).filter(User.is_admin == False).group_by(User.id).all()
+        stored = {
+            row.user_id: (row.due_count, row.total_due, row.total_paid)
+            for row in StudentBalance.query.all()
+        }
+        drifted = [row[0] for row in expected if stored.get(row[0]) != tuple(row[1:])]
+        stale = set(stored) - {row[0] for row in expected}
+        click.echo(f'{len(expected)} students checked, {len(drifted)} drifted, {len(stale)} stale rows.')
+        for user_id in drifted[:20]:
+            click.echo(f'  user {user_id}: stored {stored.get(user_id)}')
+        if check:
+            return
+        StudentBalance.query.delete(synchronize_session=False)
+        refresh_student_balances()
+        db.session.commit()
+        click.echo('student_balances rebuilt.')
+
+    @app.cli.command('export-fees')
+    @click.option('--class', 'student_class', default='all', help='Class key, e.g. 6 or 11_science.')
+    @click.option('--from', 'from_month', default='', help='First month, YYYY-MM or "July 2025".')
+    @click.option('--to', 'to_month', default='', help='Last month, YYYY-MM or "July 2025".')
+    @click.option('--status', type=click.Choice(['paid', 'unpaid']), default=None)
+    @click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default=None,
+                  help='File to write; defaults to stdout.')
+    def export_fees(student_class, from_month, to_month, status, output):
+        """Stream the fee and payment ledger as CSV."""
+        ledger = iter_fee_ledger_csv(
+            student_class=student_class,
+            from_period=month_label_to_period(from_month),
+            to_period=month_label_to_period(to_month),
+            paid={'paid': True, 'unpaid': False}.get(status)
+        )
+        out = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+        try:
+            for line in ledger:
+                out.write(line)
+        finally:
+            if output:
+                out.close()
+
+    @app.cli.command('run-scheduler')
+    @click.option('--once', is_flag=True, help='Run due jobs once and exit (for cron).')
+    @click.option('--job', 'jobs', multiple=True, help='Only run the named job(s).')
+    @click.option('--force', is_flag=True, help='Ignore the schedule; the once-per-period claim still applies.')
+    def run_scheduler(once, jobs, force):
+        """Run the scheduled jobs (dues assignment, reminders, notification purge) when they are due."""
+        from app.scheduler import JOBS, run_due_jobs
+        unknown = set(jobs) - set(JOBS)
+        if unknown:
+            raise click.BadParameter(f'unknown job(s): {", ".join(sorted(unknown))}', param_hint='--job')
+        while True:
+            for job, outcome in run_due_jobs(app, jobs=jobs or None, force=force).items():
+                click.echo(f'{job}: ' + ('already ran this period' if outcome is None else ' - '.join(outcome)))
+            if once:
+                return
+            time.sleep(app.config.get('SCHEDULER_INTERVAL_SECONDS', 300))
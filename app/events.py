@@ -0,0 +1,107 @@
+"""
+Outbound Socket.IO event queue.
+
+Request handlers and jobs hand events to `outbound` and return at once; a background
+task of the Socket.IO server delivers them every OUTBOUND_FLUSH_SECONDS. Within that
+window events are merged before delivery:
+
+* the same event with the same payload for several rooms becomes one emit to all of them;
+* for `latest_only` events (counters) only the newest payload per room is sent.
+
+At most OUTBOUND_QUEUE_MAX_PENDING merged entries wait at a time; beyond that new
+events are dropped and counted. Until start() is called (run.py does it for the web
+server) events are emitted synchronously, so CLI jobs and shells need no worker.
+"""
+import json
+import threading
+from app import socketio
+
+
+class OutboundQueue:
+    def __init__(self, max_pending=1000, flush_seconds=0.25):
+        self.max_pending = max_pending
+        self.flush_seconds = flush_seconds
+        self._pending = {}  # merge key -> [event, data, rooms, namespace]
+        self._lock = threading.Lock()
+        self._started = False
+        self._logger = None
+        self._counters = dict.fromkeys(('enqueued', 'merged', 'dropped', 'delivered', 'emits', 'failed'), 0)
+
+    def init_app(self, app):
+        self.max_pending = app.config.get('OUTBOUND_QUEUE_MAX_PENDING', self.max_pending)
+        self.flush_seconds = app.config.get('OUTBOUND_FLUSH_SECONDS', self.flush_seconds)
+        self._logger = app.logger
+
+    def start(self):
+        """Deliver from a background task of the Socket.IO server from now on"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def put(self, event, data, to, namespace='/', latest_only=False):
+        """Queue `event` for a room or list of rooms; returns False if it was dropped"""
+        rooms = [to] if isinstance(to, str) else list(to)
+        if not self._started:
+            self._emit(event, data, rooms, namespace)
+            return True
+        with self._lock:
+            self._counters['enqueued'] += 1
+            if latest_only:
+                for room in rooms:
+                    if not self._add((namespace, event, room), event, data, [room], namespace, replace=True):
+                        return False
+                return True
+            payload = json.dumps(data, sort_keys=True, default=str)
+            return self._add((namespace, event, payload), event, data, rooms, namespace)
+
+    def _add(self, key, event, data, rooms, namespace, replace=False):
+        entry = self._pending.get(key)
+        if entry is not None:
+            self._counters['merged'] += 1
+            if replace:
+                entry[1] = data
+            else:
+                entry[2].update(rooms)
+            return True
+        if len(self._pending) >= self.max_pending:
+            self._counters['dropped'] += 1
+            return False
+        self._pending[key] = [event, data, set(rooms), namespace]
+        return True
+
+    def flush(self):
+        """Deliver everything queued so far; returns the number of emits made"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for event, data, rooms, namespace in pending.values():
+            self._emit(event, data, sorted(rooms), namespace)
+        return len(pending)
+
+    def _emit(self, event, data, rooms, namespace):
+        try:
+            socketio.emit(event, data, to=rooms if len(rooms) > 1 else rooms[0], namespace=namespace)
+        except Exception as e:
+            self._counters['failed'] += 1
+            if self._logger:
+                self._logger.error(f'Error emitting {event}: {str(e)}')
+            return
+        self._counters['emits'] += 1
+        self._counters['delivered'] += len(rooms)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                if self._logger:
+                    self._logger.error(f'Outbound event flush failed: {str(e)}')
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, depth=len(self._pending), max_pending=self.max_pending, running=self._started)
+
+
+outbound = OutboundQueue()
@@ -3,6 +3,7 @@ from flask_login import UserMixin
 from datetime import datetime
 import pytz
 import os
+import re
 from werkzeug.security import generate_password_hash
 
 def get_current_time_ist():
@@ -10,6 +11,23 @@ def get_current_time_ist():
     india_tz = pytz.timezone('Asia/Kolkata')
     return datetime.now(india_tz)
 
+def month_label_to_period(label):
+    """Parse a fee month label such as 'July 2025' (or '2025-07') into the first day of that month"""
+    if not label:
+        return None
+    for fmt in ('%B %Y', '%b %Y', '%Y-%m'):
+        try:
+            return datetime.strptime(label.strip(), fmt).date().replace(day=1)
+        except ValueError:
+            continue
+    return None
+
+def normalize_payment_reference(reference):
+    """Normalize a UPI reference for duplicate checks: upper case, letters and digits only"""
+    if not reference:
+        return None
+    return re.sub(r'[^0-9A-Z]', '', reference.upper()) or None
+
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -62,13 +80,50 @@ class Mark(db.Model):
 
 class Fee(db.Model):
     __tablename__ = 'fees'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='uq_fee_user_period'),  # also serves (user_id, period) lookups
+        db.Index('idx_fee_period_id', 'period', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    month = db.Column(db.String(20), nullable=False)
+    month = db.Column(db.String(20), nullable=False)  # Display label, e.g. "July 2025"
+    period = db.Column(db.Date)  # First day of the month the due is for; set from month
     amount_due = db.Column(db.Integer, nullable=False)
     is_paid = db.Column(db.Boolean, default=False)
     payments = db.relationship('Payment', backref='fee', lazy=True)
 
+    @db.validates('month')
+    def _sync_period(self, key, value):
+        self.period = month_label_to_period(value)
+        return value
+
+class PaymentEvent(db.Model):
+    """Append-only ledger of payment state changes"""
+    __tablename__ = 'payment_events'
+    __table_args__ = (
+        db.Index('idx_payment_event_type_created', 'event_type', 'created_at'),
+        db.Index('idx_payment_event_user_created', 'user_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='SET NULL'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))  # the student; NULL once removed
+    fee_id = db.Column(db.Integer, db.ForeignKey('fees.id', ondelete='SET NULL'))
+    event_type = db.Column(db.String(20), nullable=False)  # requested, approved, rejected
+    method = db.Column(db.String(20))  # UPI or Cash
+    amount = db.Column(db.Integer)  # fee amount at the time of the event
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))  # who caused it
+    created_at = db.Column(db.DateTime, default=get_current_time_ist, nullable=False)
+
+class StudentBalance(db.Model):
+    __tablename__ = 'student_balances'
+    # Per-student dues summary, refreshed in the same transaction as every fee change
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    due_count = db.Column(db.Integer, nullable=False, default=0)
+    total_due = db.Column(db.Integer, nullable=False, default=0)
+    total_paid = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=get_current_time_ist)
+    user = db.relationship('User', backref=db.backref('balance', uselist=False))
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
@@ -76,10 +131,16 @@ class Payment(db.Model):
     fee_id = db.Column(db.Integer, db.ForeignKey('fees.id'))
     method = db.Column(db.String(20))  # UPI or Cash
     reference = db.Column(db.String(100))  # UPI reference number
+    reference_normalized = db.Column(db.String(100), index=True)  # kept in sync with reference
     is_confirmed = db.Column(db.Boolean, default=False)
     requested_at = db.Column(db.DateTime, default=get_current_time_ist)
     confirmed_at = db.Column(db.DateTime)
 
+    @db.validates('reference')
+    def _sync_reference_normalized(self, key, value):
+        self.reference_normalized = normalize_payment_reference(value)
+        return value
+
 class PDF(db.Model):
     __tablename__ = 'pdfs'
     id = db.Column(db.Integer, primary_key=True)
@@ -88,15 +149,39 @@ class PDF(db.Model):
     uploaded_at = db.Column(db.DateTime, default=get_current_time_ist)
     class_for = db.Column(db.String(20), nullable=False, default='all')
 
+# What a notification is about; stored in Notification.kind
+NOTIFICATION_KINDS = ('general', 'pdf', 'test', 'resource', 'fee_due', 'fee_reminder')
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('idx_notification_user_created', 'user_id', 'created_at'),
+        db.Index('idx_notification_class_created', 'class_for', 'created_at'),
+        db.Index('idx_notification_user_kind_created', 'user_id', 'kind', 'created_at'),
+        db.Index('idx_notification_class_kind_created', 'class_for', 'kind', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True)  # null for all students
     message = db.Column(db.Text, nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='general', server_default='general')  # one of NOTIFICATION_KINDS
+    ref_id = db.Column(db.Integer)  # id of the PDF, Test or Resource the notification announces
     created_at = db.Column(db.DateTime, default=get_current_time_ist)
     is_read = db.Column(db.Boolean, default=False)
     class_for = db.Column(db.String(20), nullable=True)  # null means all classes
-    seen = db.Column(db.Boolean, default=False)  # 0 = not seen, 1 = seen
+    seen = db.Column(db.Boolean, default=False)  # legacy global flag; per-student state lives in NotificationReceipt
+
+    @db.validates('kind')
+    def _check_kind(self, key, value):
+        if value not in NOTIFICATION_KINDS:
+            raise ValueError(f'Unknown notification kind: {value}')
+        return value
+
+class NotificationReceipt(db.Model):
+    """One row per student per notification they have been shown"""
+    __tablename__ = 'notification_receipts'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True, index=True)
+    seen_at = db.Column(db.DateTime, default=get_current_time_ist, nullable=False)
 
 class Setting(db.Model):
     __tablename__ = 'settings'
@@ -133,7 +218,18 @@ class UPISettingChangeLog(db.Model):
     old_value = db.Column(db.String(256))
     new_value = db.Column(db.String(256))
     changed_at = db.Column(db.DateTime, default=get_current_time_ist)
-    admin_user = db.relationship('User', backref='upi_setting_change_logs') 
+    admin_user = db.relationship('User', backref='upi_setting_change_logs')
+
+class ScheduledRun(db.Model):
+    __tablename__ = 'scheduled_runs'
+    __table_args__ = (db.UniqueConstraint('job', 'period_key', name='uq_scheduled_run_job_period'),)
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(64), nullable=False)
+    period_key = db.Column(db.String(32), nullable=False)  # e.g. '2025-07' for monthly jobs
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, done, failed
+    started_at = db.Column(db.DateTime, default=get_current_time_ist)
+    finished_at = db.Column(db.DateTime)
+    detail = db.Column(db.Text)
 
 def create_admin_from_env():
     admins = [
@@ -1,12 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, Response, stream_with_context, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-from app.models import User, PDF, Notification, Profile, Test, Mark, Fee, Payment, Setting, Resource, DropoutRequest
+from app.models import User, PDF, Notification, Profile, Test, Mark, Fee, Payment, Setting, Resource, DropoutRequest, StudentBalance, NotificationReceipt, month_label_to_period
 from app.forms import LoginForm, AdminPDFUploadForm, AdminNotificationForm, AdminTestUploadForm, PasswordResetRequestForm, PasswordResetForm, AddAdminUserForm, UPISettingsForm, ResourceForm
-from app import db, socketio, csrf
-from app.utils import get_pending_approvals_count, generate_password_reset_token, verify_password_reset_token, send_password_reset_email, validate_pdf_file, generate_secure_filename, cleanup_old_files, get_leaderboard_for_class, assign_monthly_dues, get_fee_amount_for_class, get_current_time_ist
+from app import db, csrf
+from app.cache import invalidate_on_commit
+from app.sockets import live_emit, class_room
+from app.events import outbound
+from app.utils import get_pending_approvals_count, notification_cutoff, invalidate_leaderboard, count_new_notification, adjust_pending_approvals, PENDING_APPROVALS_CACHE_KEY, generate_password_reset_token, verify_password_reset_token, send_password_reset_email, validate_pdf_file, generate_secure_filename, cleanup_old_files, get_leaderboard_for_class, assign_monthly_dues, bulk_upsert_dues, get_approval_queue, process_payments, record_payment_events, detach_payment_events, get_payment_timeline, refresh_student_balances, get_feedues_report, get_dues_page, get_fee_month_summary, iter_fee_ledger_csv, FEE_SUMMARY_CACHE_PREFIX, get_fee_amount_for_class, get_current_time_ist
 import os
-from datetime import datetime, date, timedelta
+import csv
+import io
+from datetime import datetime, date
 import pytz
 
 admin_bp = Blueprint('admin', __name__)
@@ -93,12 +98,15 @@ def upload_pdfs():
             note = Notification(
                 user_id=None,
                 message=f'📄 <b>{title}</b> is now available for <b>{class_label}</b>! <a href="{url_for("student.pdfs")}" class="underline">Download from Study Material</a>',
-                class_for=class_for
+                class_for=class_for,
+                kind='pdf',
+                ref_id=pdf.id
             )
             db.session.add(note)
+            count_new_notification(class_for=class_for)
             db.session.commit()
             flash('PDF uploaded successfully!', 'success')
-            socketio.emit('new_pdf', {'message': f'New PDF "{title}" uploaded for {class_label}.', 'url': url_for('student.pdfs'), 'button': 'Open it'})
+            live_emit('new_pdf', {'message': f'New PDF "{title}" uploaded for {class_label}.', 'url': url_for('student.pdfs'), 'button': 'Open it'}, to=class_room(class_for))
         except Exception as e:
             db.session.rollback()
             flash(f'Error uploading PDF: {str(e)}', 'danger')
@@ -127,22 +135,19 @@ def notifystudents():
         class_for = form.class_for.data
         note = Notification(user_id=None, message=message, class_for=class_for)
         db.session.add(note)
+        count_new_notification(class_for=class_for)
         db.session.commit()
         flash('Notification sent!', 'success')
-        socketio.emit('new_notification', {'message': message, 'url': url_for('student.notifications'), 'button': 'See it'})
+        live_emit('new_notification', {'message': message, 'url': url_for('student.notifications'), 'button': 'See it'}, to=class_room(class_for))
         return redirect(url_for('admin.notifystudents'))
 
-    # Delete old notifications (older than 15 days)
-    cutoff = datetime.now() - timedelta(days=15)
-    Notification.query.filter(Notification.created_at < cutoff).delete(synchronize_session=False)
-    db.session.commit()
-
+    # Old notifications are removed by the scheduled purge job; until then just hide them
     # Fetch all notifications for display (no 10-message limit)
     notifications = Notification.query.filter(
         Notification.user_id == None,
         Notification.message != None,
         Notification.message != '',
-        Notification.created_at >= cutoff
+        Notification.created_at >= notification_cutoff()
     ).order_by(Notification.created_at.desc()).all()
     return render_template('admin/notifystudents.html', notifications=notifications, form=form)
 
@@ -176,7 +181,9 @@ def student_profile(student_id):
         dues = Fee.query.filter_by(user_id=student.user_id, is_paid=False).all()
         # Get optimized leaderboard for the student's class
         leaderboard = get_leaderboard_for_class(student.student_class)
-        return render_template('admin/student_profile.html', student=student, marks=marks, dues=dues, leaderboard=leaderboard)
+        payment_timeline = get_payment_timeline(student.user_id)
+        return render_template('admin/student_profile.html', student=student, marks=marks, dues=dues, leaderboard=leaderboard,
+                               payment_timeline=payment_timeline)
     except Exception as e:
         flash('Error loading student profile. Please try again.', 'danger')
         current_app.logger.error(f'Student profile error: {str(e)}')
@@ -231,12 +238,15 @@ def test_upload():
             # Store notification in DB (class-specific)
             note = Notification(
                 message=f'📝 <b>{name}</b> test is now available for <b>{class_label}</b>! <a href="{url_for("student.test_update")}" class="underline">Update your marks</a>',
-                class_for=class_for
+                class_for=class_for,
+                kind='test',
+                ref_id=test.id
             )
             db.session.add(note)
+            count_new_notification(class_for=class_for)
             db.session.commit()
             flash('Test created successfully!', 'success')
-            socketio.emit('new_test', {'message': f'New test "{name}" uploaded for {class_label}.', 'url': url_for('student.test_update'), 'button': 'Update'})
+            live_emit('new_test', {'message': f'New test "{name}" uploaded for {class_label}.', 'url': url_for('student.test_update'), 'button': 'Update'}, to=class_room(class_for))
         except Exception as e:
             db.session.rollback()
             flash(f'Error creating test: {str(e)}', 'danger')
@@ -304,46 +314,26 @@ def fee_management():
     india_tz = pytz.timezone('Asia/Kolkata')
     now = datetime.now(india_tz)
     current_month_label = now.strftime('%B %Y')
-    # Get students in selected class
-    students_in_class = Profile.query.filter_by(student_class=selected_class).order_by(Profile.roll_number).all()
-    # Get fees for selected class and current month
-    all_fees = Fee.query.join(User).join(Profile).filter(
-        Profile.student_class == selected_class,
-        Fee.month == current_month_label
-    ).order_by(Fee.month.desc()).all()
-    # Calculate summary statistics
-    total_students = len(students_in_class)
-    total_fees = sum(fee.amount_due for fee in all_fees)
-    total_outstanding = sum(fee.amount_due for fee in all_fees if not fee.is_paid)
-    # Get students with at least one unpaid fee (dues)
-    students_with_dues_list = []
-    for student in students_in_class:
-        unpaid_fees = Fee.query.filter_by(user_id=student.user_id, is_paid=False, month=current_month_label).all()
-        if unpaid_fees:
-            students_with_dues_list.append({'profile': student})
-    # Current month dues status
-    current_month_dues = Fee.query.filter_by(month=current_month_label).count()
-    monthly_dues_completed = current_month_dues >= total_students
-    # Get current monthly due amount from settings
-    monthly_due_setting = Setting.query.filter_by(key='monthly_due_amount').first()
-    current_monthly_amount = int(monthly_due_setting.value) if monthly_due_setting and monthly_due_setting.value.isdigit() else 1500
+    current_period = month_label_to_period(current_month_label)
+    summary = get_fee_month_summary(selected_class, current_period)
+    monthly_dues_completed = summary['current_month_dues'] >= summary['total_students']
     # Show popup if there are pending approvals
-    approval_count = Payment.query.filter_by(is_confirmed=False).count()
+    approval_count = get_pending_approvals_count()
     if approval_count > 0:
         flash('Students waiting for approval. <a href="' + url_for('admin.approve') + '" class="underline">Open Approvals</a>', 'warning')
     return render_template('admin/fee_management.html',
-                         all_students=students_in_class,
-                         all_fees=all_fees,
-                         total_students=total_students,
-                         total_fees=total_fees,
-                         total_outstanding=total_outstanding,
-                         students_with_dues_list=students_with_dues_list,
-                         students_with_dues=len(students_with_dues_list),
+                         all_students=summary['students'],
+                         all_fees=summary['fees'],
+                         total_students=summary['total_students'],
+                         total_fees=summary['total_fees'],
+                         total_outstanding=summary['total_outstanding'],
+                         students_with_dues_list=summary['students_with_dues_list'],
+                         students_with_dues=summary['students_with_dues'],
                          approval_count=approval_count,
                          current_month_label=current_month_label,
-                         current_month_dues=current_month_dues,
+                         current_month_dues=summary['current_month_dues'],
                          monthly_dues_completed=monthly_dues_completed,
-                         current_monthly_amount=current_monthly_amount,
+                         current_monthly_amount=summary['current_monthly_amount'],
                          selected_class=selected_class)
 
 @admin_bp.route('/add_fee', methods=['POST'])
@@ -363,14 +353,19 @@ def add_fee():
         if not student_profile:
             flash('Student profile not found.', 'danger')
             return redirect(url_for('admin.fee_management'))
+        period = month_label_to_period(month)
+        if not period:
+            flash('Invalid month. Use a label like "July 2025".', 'danger')
+            return redirect(url_for('admin.fee_management'))
         fee_amount = get_fee_amount_for_class(student_profile.student_class)
         # Check if fee already exists for this user and month
-        existing_fee = Fee.query.filter_by(user_id=user_id, month=month).first()
+        existing_fee = Fee.query.filter_by(user_id=user_id, period=period).first()
         if existing_fee:
             flash(f'Fee for {month} already exists for this student.', 'danger')
         else:
             fee = Fee(user_id=user_id, month=month, amount_due=fee_amount)
             db.session.add(fee)
+            refresh_student_balances([user_id])
             db.session.commit()
             flash(f'Fee added successfully for {month}.', 'success')
     else:
@@ -390,6 +385,9 @@ def confirm_payment(payment_id):
         payment.is_confirmed = True
         payment.confirmed_at = get_current_time_ist()
         payment.fee.is_paid = True
+        refresh_student_balances([payment.fee.user_id])
+        record_payment_events('approved', [payment.id], current_user.id)
+        adjust_pending_approvals(-1)
         db.session.commit()
         flash('Cash payment confirmed successfully!', 'success')
     else:
@@ -403,40 +401,20 @@ def approve():
     if not current_user.is_admin:
         return redirect(url_for('student.home'))
     
-    # Get pending cash payments
-    pending_cash_payments = Payment.query.filter_by(method='Cash', is_confirmed=False).join(Fee).join(User).join(Profile).order_by(Payment.requested_at.desc()).all()
-    
-    # Get pending UPI payments
-    pending_upi_payments = Payment.query.filter_by(method='UPI', is_confirmed=False).join(Fee).join(User).join(Profile).order_by(Payment.requested_at.desc()).all()
-    
-    # Get recent approvals (only confirmed payments)
-    recent_approvals = Payment.query.filter(
-        Payment.is_confirmed == True
-    ).join(Fee).join(User).join(Profile).order_by(Payment.confirmed_at.desc()).limit(10).all()
-    
-    # Calculate statistics
-    pending_cash_count = len(pending_cash_payments)
-    pending_upi_count = len(pending_upi_payments)
+    queue = get_approval_queue()
+    pending_cash_count = queue['pending_cash_count']
+    pending_upi_count = queue['pending_upi_count']
     total_pending = pending_cash_count + pending_upi_count
-    
-    approved_today = Payment.query.filter(
-        Payment.is_confirmed == True,
-        Payment.confirmed_at >= date.today()
-    ).count()
-    
-    # For rejected payments, we need to track them differently since they're deleted
-    # For now, we'll show 0 rejected today since rejected payments are deleted
-    rejected_today = 0
-    
+
     return render_template('admin/approve.html',
-                         pending_cash_payments=pending_cash_payments,
-                         pending_upi_payments=pending_upi_payments,
-                         recent_approvals=recent_approvals,
+                         pending_cash_payments=queue['pending_cash_payments'],
+                         pending_upi_payments=queue['pending_upi_payments'],
+                         recent_approvals=queue['recent_approvals'],
                          pending_cash_count=pending_cash_count,
                          pending_upi_count=pending_upi_count,
                          total_pending=total_pending,
-                         approved_today=approved_today,
-                         rejected_today=rejected_today)
+                         approved_today=queue['approved_today'],
+                         rejected_today=queue['rejected_today'])
 
 @admin_bp.route('/notify_student/<int:student_id>', methods=['POST'])
 @login_required
@@ -462,6 +440,10 @@ def approve_payment(payment_id):
         return redirect(url_for('main.login'))
     
     payment = Payment.query.get_or_404(payment_id)
+    if payment.is_confirmed:
+        flash('This payment has already been processed.', 'danger')
+        return redirect(url_for('admin.approve'))
+    adjust_pending_approvals(-1)
     payment.is_confirmed = True
     payment.confirmed_at = get_current_time_ist()
     
@@ -469,6 +451,8 @@ def approve_payment(payment_id):
     fee = Fee.query.get(payment.fee_id)
     if fee:
         fee.is_paid = True
+        refresh_student_balances([fee.user_id])
+    record_payment_events('approved', [payment.id], current_user.id)
     
     db.session.commit()
     flash('Payment approved successfully!', 'success')
@@ -483,13 +467,55 @@ def reject_payment(payment_id):
         return redirect(url_for('main.login'))
     
     payment = Payment.query.get_or_404(payment_id)
-    payment.is_confirmed = True  # Mark as processed
+    if payment.is_confirmed:
+        flash('This payment has already been processed.', 'danger')
+        return redirect(url_for('admin.approve'))
+    adjust_pending_approvals(-1)
+    payment.is_confirmed = True  # Mark as processed; the rejected event tells it apart from an approval
     payment.confirmed_at = get_current_time_ist()
+    record_payment_events('rejected', [payment.id], current_user.id)
+    invalidate_on_commit(FEE_SUMMARY_CACHE_PREFIX)
     
     db.session.commit()
     flash('Payment rejected successfully!', 'success')
     return redirect(url_for('admin.approve'))
 
+@admin_bp.route('/process_payments', methods=['POST'])
+@login_required
+@csrf.exempt
+def process_payments_bulk():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied.'}), 403
+    # JSON body: {"action": "approve" | "reject", "payment_ids": [1, 2, ...]}
+    payload = request.get_json(silent=True) or {}
+    action = payload.get('action')
+    payment_ids = payload.get('payment_ids')
+    if action not in ('approve', 'reject'):
+        return jsonify({'error': 'action must be "approve" or "reject".'}), 400
+    if not isinstance(payment_ids, list) or not payment_ids:
+        return jsonify({'error': 'Provide a non-empty list of payment_ids.'}), 400
+    try:
+        payment_ids = [int(payment_id) for payment_id in payment_ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'payment_ids must be integers.'}), 400
+
+    try:
+        result = process_payments(payment_ids, action, actor_id=current_user.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error processing payments in bulk: {str(e)}')
+        return jsonify({'error': 'Could not process the payments. Please try again.'}), 500
+    return jsonify(result)
+
+@admin_bp.route('/event_queue_stats')
+@login_required
+def event_queue_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied.'}), 403
+    # Depth and counters of the outbound Socket.IO event queue (app/events.py)
+    return jsonify(outbound.stats())
+
 @admin_bp.route('/feedues')
 @login_required
 def feedues():
@@ -497,45 +523,23 @@ def feedues():
         return redirect(url_for('student.home'))
 
     selected_class = request.args.get('class_for', 'all')
-    if selected_class == 'all':
-        all_students = Profile.query.all()
-    else:
-        all_students = Profile.query.filter_by(student_class=selected_class).all()
-
-    students_with_dues_list = []
-    students_paid_up_list = []
-    total_outstanding = 0
-
-    for student in all_students:
-        fees = Fee.query.filter_by(user_id=student.user_id).all()
-        outstanding_fees = [fee for fee in fees if not fee.is_paid]
-        paid_fees = [fee for fee in fees if fee.is_paid]
-        total_due = sum(fee.amount_due for fee in outstanding_fees)
-        total_paid = sum(fee.amount_due for fee in paid_fees)
-        if outstanding_fees:
-            students_with_dues_list.append({
-                'profile': student,
-                'outstanding_fees': outstanding_fees,
-                'due_count': len(outstanding_fees),
-                'total_due': total_due
-            })
-            total_outstanding += total_due
-        else:
-            students_paid_up_list.append({
-                'profile': student,
-                'total_paid': total_paid
-            })
-
-    # Sort students with dues by due count (descending), then by total_due (descending)
-    students_with_dues_list.sort(key=lambda x: (x['due_count'], x['total_due']), reverse=True)
+    report = get_feedues_report(
+        selected_class,
+        after=request.args.get('after'),
+        limit=current_app.config.get('FEEDUES_PAGE_SIZE', 50)
+    )
+    students_with_dues_list = report['students_with_dues_list']
+    students_paid_up_list = report['students_paid_up_list']
 
     return render_template('admin/feedues.html',
                          students_with_dues_list=students_with_dues_list,
                          students_paid_up_list=students_paid_up_list,
-                         students_with_dues=len(students_with_dues_list),
-                         students_paid_up=len(students_paid_up_list),
-                         total_outstanding=total_outstanding,
-                         total_students=len(all_students),
+                         students_with_dues=report['students_with_dues'],
+                         students_paid_up=report['total_students'] - report['students_with_dues'],
+                         total_outstanding=report['total_outstanding'],
+                         total_students=report['total_students'],
+                         next_cursor=report['next_cursor'],
+                         is_first_page=not request.args.get('after'),
                          selected_class=selected_class)
 
 @admin_bp.route('/dues', methods=['GET', 'POST'])
@@ -551,26 +555,23 @@ def dues_management():
         month = request.form.get('month')
         amount = request.form.get('amount')
         is_paid = request.form.get('is_paid') == 'on'
-        if selected_students and month and amount:
-            added_count = 0
-            skipped_count = 0
-            for user_id in selected_students:
-                # Check if due already exists for this user and month
-                existing_due = Fee.query.filter_by(user_id=user_id, month=month).first()
-                if not existing_due:
-                    fee = Fee(user_id=user_id, month=month, amount_due=int(amount), is_paid=is_paid)
-                    db.session.add(fee)
-                    added_count += 1
-                else:
-                    skipped_count += 1
+        if month and not month_label_to_period(month):
+            flash('Invalid month. Use a label like "July 2025".', 'danger')
+        elif selected_students and month and amount:
+            result = bulk_upsert_dues(
+                [{'user_id': user_id, 'month': month, 'amount': amount, 'paid': is_paid} for user_id in selected_students],
+                update_existing=False
+            )
             db.session.commit()
-            if added_count > 0:
-                flash(f'Due added for {added_count} students successfully.', 'success')
-            if skipped_count > 0:
-                flash(f'Skipped {skipped_count} students (dues already exist for this month).', 'warning')
+            if result['inserted'] > 0:
+                flash(f'Due added for {result["inserted"]} students successfully.', 'success')
+            if result['skipped'] > 0:
+                flash(f'Skipped {result["skipped"]} students (dues already exist for this month).', 'warning')
+            if result['invalid'] > 0:
+                flash(f'{result["invalid"]} selections were invalid and ignored.', 'danger')
         else:
             flash('Please select at least one student and fill all required fields.', 'danger')
-        return redirect(url_for('admin.dues_management'))
+        return redirect(url_for('admin.dues_management', **request.args))
 
     # Handle edit due form
     if request.method == 'POST' and 'edit_due' in request.form:
@@ -579,15 +580,21 @@ def dues_management():
         month = request.form.get('edit_month')
         is_paid = request.form.get('edit_is_paid') == 'on'
         fee = Fee.query.get(fee_id)
-        if fee:
+        period = month_label_to_period(month)
+        if fee and not period:
+            flash('Invalid month. Use a label like "July 2025".', 'danger')
+        elif fee and Fee.query.filter(Fee.user_id == fee.user_id, Fee.period == period, Fee.id != fee.id).first():
+            flash(f'This student already has a due for {month}.', 'danger')
+        elif fee:
             fee.amount_due = int(amount)
             fee.month = month
             fee.is_paid = is_paid
+            refresh_student_balances([fee.user_id])
             db.session.commit()
             flash('Due updated successfully.', 'success')
         else:
             flash('Due not found.', 'danger')
-        return redirect(url_for('admin.dues_management'))
+        return redirect(url_for('admin.dues_management', **request.args))
 
     # Handle delete due
     if request.method == 'POST' and 'delete_due' in request.form:
@@ -595,11 +602,12 @@ def dues_management():
         fee = Fee.query.get(fee_id)
         if fee:
             db.session.delete(fee)
+            refresh_student_balances([fee.user_id])
             db.session.commit()
             flash('Due deleted successfully.', 'success')
         else:
             flash('Due not found.', 'danger')
-        return redirect(url_for('admin.dues_management'))
+        return redirect(url_for('admin.dues_management', **request.args))
 
     # Handle mark as paid/unpaid
     if request.method == 'POST' and 'toggle_paid' in request.form:
@@ -607,20 +615,115 @@ def dues_management():
         fee = Fee.query.get(fee_id)
         if fee:
             fee.is_paid = not fee.is_paid
+            refresh_student_balances([fee.user_id])
             db.session.commit()
             flash('Due payment status updated.', 'success')
         else:
             flash('Due not found.', 'danger')
-        return redirect(url_for('admin.dues_management'))
+        return redirect(url_for('admin.dues_management', **request.args))
+
+    # Filtered, keyset-paginated listing
+    selected_class = request.args.get('class_for', 'all')
+    selected_month = request.args.get('month', '')
+    status = request.args.get('status', '')
+    student_query = request.args.get('student', '').strip()
+    page = get_dues_page(
+        selected_class,
+        period=month_label_to_period(selected_month),
+        paid={'paid': True, 'unpaid': False}.get(status),
+        student=student_query or None,
+        after=request.args.get('after'),
+        limit=current_app.config.get('DUES_PAGE_SIZE', 50)
+    )
+    students = db.session.query(
+        Profile.user_id, Profile.full_name, Profile.roll_number, Profile.student_class
+    ).order_by(Profile.roll_number).all()
 
-    # List all dues (reuse fee_management table data)
-    dues = Fee.query.order_by(Fee.month.desc()).all()
-    students = Profile.query.order_by(Profile.roll_number).all()
-    
     # Pass current date for month options
     now = datetime.now()
-    
-    return render_template('admin/dues_management.html', dues=dues, students=students, now=now)
+
+    return render_template('admin/dues_management.html',
+                         dues=page['dues'],
+                         next_cursor=page['next_cursor'],
+                         is_first_page=not request.args.get('after'),
+                         students=students,
+                         selected_class=selected_class,
+                         selected_month=selected_month,
+                         status=status,
+                         student_query=student_query,
+                         now=now)
+
+@admin_bp.route('/dues/bulk', methods=['POST'])
+@login_required
+@csrf.exempt
+def bulk_dues():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied.'}), 403
+    # Accepts a JSON body ({"rows": [...], "dry_run": true} or a bare list) or a CSV upload
+    # with columns user_id or reg_no, month, amount, paid
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        rows = payload.get('rows') if isinstance(payload, dict) else payload
+        dry_run = bool(payload.get('dry_run')) if isinstance(payload, dict) else request.args.get('dry_run') == '1'
+    elif request.files.get('file'):
+        try:
+            rows = list(csv.DictReader(io.StringIO(request.files['file'].read().decode('utf-8-sig'))))
+        except UnicodeDecodeError:
+            rows = None
+        dry_run = request.form.get('dry_run') in ('1', 'on')
+    else:
+        rows, dry_run = None, False
+
+    wants_html = request.form.get('format') == 'html'
+    error = None
+    if not isinstance(rows, list) or not rows:
+        error = 'Provide a non-empty list of rows or a UTF-8 CSV file.'
+    elif len(rows) > current_app.config.get('BULK_DUES_MAX_ROWS', 5000):
+        error = f'Too many rows; the limit is {current_app.config.get("BULK_DUES_MAX_ROWS", 5000)} per upload.'
+    if error:
+        if wants_html:
+            flash(error, 'danger')
+            return redirect(url_for('admin.dues_management'))
+        return jsonify({'error': error}), 400
+
+    try:
+        result = bulk_upsert_dues(rows, dry_run=dry_run)
+        if not dry_run:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk dues upsert error: {str(e)}')
+        if wants_html:
+            flash('Error saving dues. Nothing was changed.', 'danger')
+            return redirect(url_for('admin.dues_management'))
+        return jsonify({'error': 'Error saving dues. Nothing was changed.'}), 500
+
+    if wants_html:
+        prefix = 'Dry run: ' if dry_run else ''
+        flash(f'{prefix}{result["inserted"]} inserted, {result["updated"]} updated, {result["skipped"]} skipped, {result["invalid"]} invalid.', 'info' if dry_run else 'success')
+        for entry in [r for r in result['results'] if r['status'] == 'invalid'][:5]:
+            flash(f'Row {entry["row"] + 1}: {entry["reason"]}', 'warning')
+        return redirect(url_for('admin.dues_management'))
+    return jsonify(result)
+
+@admin_bp.route('/export/fees.csv')
+@login_required
+def export_fees():
+    if not current_user.is_admin:
+        return redirect(url_for('student.home'))
+    # Filters: class_for, from/to as YYYY-MM (or "July 2025"), status=paid|unpaid
+    ledger = iter_fee_ledger_csv(
+        student_class=request.args.get('class_for', 'all'),
+        from_period=month_label_to_period(request.args.get('from', '')),
+        to_period=month_label_to_period(request.args.get('to', '')),
+        paid={'paid': True, 'unpaid': False}.get(request.args.get('status'))
+    )
+    filename = f"fee_ledger_{get_current_time_ist().strftime('%Y%m%d_%H%M')}.csv"
+    return Response(
+        stream_with_context(ledger),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @admin_bp.route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
@@ -851,6 +954,7 @@ def edit_mark(mark_id):
         if new_marks and new_marks.isdigit():
             mark.marks_obtained = int(new_marks)
             mark.updated_at = get_current_time_ist()
+            invalidate_leaderboard(profile.student_class if profile else None)
             db.session.commit()
             flash('Mark updated successfully!', 'success')
             return redirect(url_for('admin.test_marks_management'))
@@ -875,6 +979,7 @@ def delete_mark(mark_id):
         current_app.logger.warning(f'Admin {current_user.id} ({current_user.email}) deleted mark {mark.marks_obtained}/{test.total_marks} for student {user.id} ({user.email}) for test {test.id}')
         
         db.session.delete(mark)
+        invalidate_leaderboard(user.profile.student_class if user and user.profile else None)
         db.session.commit()
         
         flash('Mark deleted successfully.', 'success')
@@ -950,32 +1055,22 @@ def suspicious_activity():
 def trigger_monthly_dues():
     if not current_user.is_admin:
         return redirect(url_for('student.home'))
-    from app.utils import get_fee_amount_for_class
     india_tz = pytz.timezone('Asia/Kolkata')
     now = datetime.now(india_tz)
     current_month_label = now.strftime('%B %Y')
-    all_students = Profile.query.order_by(Profile.roll_number).all()
-    added_count = 0
-    skipped_count = 0
-    for student in all_students:
-        # Check if fee already exists for this user and month
-        existing_fee = Fee.query.filter_by(user_id=student.user_id, month=current_month_label).first()
-        if not existing_fee:
-            fee_amount = get_fee_amount_for_class(student.student_class)
-            fee = Fee(user_id=student.user_id, month=current_month_label, amount_due=fee_amount)
-            db.session.add(fee)
-            added_count += 1
-            # Create notification for the student
-            notification_message = f"{current_month_label} month due added. Please complete the due"
-            existing_notification = Notification.query.filter_by(user_id=student.user_id, message=notification_message).first()
-            if not existing_notification:
-                notification = Notification(user_id=student.user_id, message=notification_message)
-                db.session.add(notification)
-                db.session.commit()
-        else:
-            skipped_count += 1
-    db.session.commit()
-    flash(f'Monthly dues assigned: {added_count} students, skipped {skipped_count} (already assigned).', 'success')
+    dry_run = request.form.get('dry_run') == '1'
+    try:
+        # Same per-class path as the scheduled monthly_dues job
+        result = assign_monthly_dues(dry_run=dry_run)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Monthly dues assignment error: {str(e)}')
+        flash('Error assigning monthly dues. No dues were added.', 'danger')
+        return redirect(url_for('admin.fee_management'))
+    if dry_run:
+        flash(f'Preview for {current_month_label}: {result["added"]} students would get a new due, {result["skipped"]} already assigned.', 'info')
+    else:
+        flash(f'Monthly dues assigned: {result["added"]} students, skipped {result["skipped"]} (already assigned).', 'success')
     return redirect(url_for('admin.fee_management'))
 
 @admin_bp.route('/resource', methods=['GET', 'POST'])
@@ -1016,15 +1111,16 @@ def resource():
             class_label = class_labels.get(class_for, class_for)
             # Store notification in DB (class-specific)
             message = f'📚 <b>{form.name.data}</b> resource is now available for <b>{class_label}</b>! <a href="{url_for("student.resources")}" class="underline">Open Resource</a>'
-            notification = Notification(message=message, class_for=class_for)
+            notification = Notification(message=message, class_for=class_for, kind='resource', ref_id=resource.id)
             db.session.add(notification)
+            count_new_notification(class_for=class_for)
             db.session.commit()
             # Send real-time notification via SocketIO
-            socketio.emit('new_notification', {
+            live_emit('new_notification', {
                 'message': message,
                 'url': url_for('student.resources'),
                 'button': 'View Resources'
-            })
+            }, to=class_room(class_for))
             flash('Resource added successfully! Students will be notified.', 'success')
             return redirect(url_for('admin.resource'))
         except Exception as e:
@@ -1059,8 +1155,9 @@ def dropout_request_detail(request_id):
         return redirect(url_for('student.home'))
     dropout = DropoutRequest.query.get_or_404(request_id)
     student = Profile.query.filter_by(user_id=dropout.user_id).first()
-    dues = Fee.query.filter_by(user_id=dropout.user_id, is_paid=False).all()
-    total_due = sum(fee.amount_due for fee in dues)
+    balance = StudentBalance.query.get(dropout.user_id)
+    total_due = balance.total_due if balance else 0
+    dues = Fee.query.filter_by(user_id=dropout.user_id, is_paid=False).order_by(Fee.period).all() if total_due else []
     if request.method == 'POST':
         action = request.form.get('action')
         if action == 'approve' and total_due == 0:
@@ -1080,10 +1177,14 @@ def dropout_request_detail(request_id):
                     db.session.delete(profile)
                 # Delete related Fees
                 Fee.query.filter_by(user_id=user.id).delete()
-                # Delete related Payments
+                StudentBalance.query.filter_by(user_id=user.id).delete()
+                # Delete related Payments; their events stay in the ledger, detached from the student
+                detach_payment_events(user.id)
                 Payment.query.filter_by(user_id=user.id).delete()
+                invalidate_on_commit(PENDING_APPROVALS_CACHE_KEY)
                 # Delete related Marks
                 Mark.query.filter_by(user_id=user.id).delete()
+                NotificationReceipt.query.filter_by(user_id=user.id).delete()
                 # (Add other related deletions as needed)
                 db.session.delete(user)
                 db.session.commit()
@@ -1138,10 +1239,14 @@ def remove_students():
         db.session.delete(student)
         # Delete related Fees
         Fee.query.filter_by(user_id=user.id).delete()
-        # Delete related Payments
+        StudentBalance.query.filter_by(user_id=user.id).delete()
+        # Delete related Payments; their events stay in the ledger, detached from the student
+        detach_payment_events(user.id)
         Payment.query.filter_by(user_id=user.id).delete()
+        invalidate_on_commit(PENDING_APPROVALS_CACHE_KEY)
         # Delete related Marks
         Mark.query.filter_by(user_id=user.id).delete()
+        NotificationReceipt.query.filter_by(user_id=user.id).delete()
         # (Add other related deletions as needed)
         db.session.delete(user)
         db.session.commit()
@@ -1149,10 +1254,13 @@ def remove_students():
         flash(f'{student_name} successfully removed and roll numbers resequenced.', 'success')
         return redirect(url_for('admin.remove_students', class_for=selected_class))
     # Attach dues info
+    balances = {}
+    if students:
+        balances = {b.user_id: b for b in StudentBalance.query.filter(StudentBalance.user_id.in_([s.user_id for s in students]))}
     students_with_dues = []
     for s in students:
-        dues = Fee.query.filter_by(user_id=s.user_id, is_paid=False).all()
-        students_with_dues.append({'student': s, 'dues_count': len(dues), 'dues_total': sum(f.amount_due for f in dues)})
+        balance = balances.get(s.user_id)
+        students_with_dues.append({'student': s, 'dues_count': balance.due_count if balance else 0, 'dues_total': balance.total_due if balance else 0})
     return render_template('admin/remove_students.html', students=students_with_dues, selected_class=selected_class, search=search)
 
 def resequence_roll_numbers(student_class):
@@ -1165,6 +1273,7 @@ def resequence_roll_numbers(student_class):
     # Step 2: Assign correct sequential roll numbers
     for idx, student in enumerate(students, start=1):
         student.roll_number = idx
+    invalidate_leaderboard(student_class)
     db.session.commit()
 
  
@@ -1,12 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, make_response, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import User, Profile, PDF, Notification, Test, Mark, Fee, Payment, Setting, Resource, DropoutRequest
+from app.models import User, Profile, PDF, Notification, Test, Mark, Fee, Payment, Setting, Resource, DropoutRequest, StudentBalance
 from app.forms import StudentSignupForm, LoginForm, StudentTestUpdateForm, PasswordResetRequestForm, PasswordResetForm
 from app import db, login_manager, csrf
 from datetime import datetime, timedelta
 from flask_wtf.csrf import generate_csrf
-from app.utils import generate_password_reset_token, verify_password_reset_token, send_password_reset_email, get_leaderboard_for_class
+from app.utils import generate_password_reset_token, verify_password_reset_token, send_password_reset_email, get_leaderboard_for_class, invalidate_leaderboard, pop_unseen_notification, pop_latest_unread_notification, mark_notifications_read, get_unread_notification_count, get_notifications_page, get_student_fee_page, get_fee_page_validator, find_duplicate_reference, record_payment_events, adjust_pending_approvals, FEE_SUMMARY_CACHE_PREFIX
+from app.cache import invalidate_on_commit
 
 student_bp = Blueprint('student', __name__)
 
@@ -42,6 +43,7 @@ def signup():
             roll_number=next_roll
         )
         db.session.add(profile)
+        invalidate_leaderboard(profile.student_class)
         db.session.commit()
         # Assign reg_no after profile.id is available
         class_code_map = {
@@ -88,26 +90,18 @@ def home():
         profile.pending_popup = None
         db.session.commit()
     
-    # Build a queue of unseen notifications (class or personal)
-    unseen_notifications = Notification.query.filter(
-        ((Notification.user_id == None) & ((Notification.class_for == 'all') | (Notification.class_for == profile.student_class))) |
-        (Notification.user_id == current_user.id),
-        Notification.seen == False
-    ).order_by(Notification.created_at.asc()).all()
-
+    # Show the oldest notification (class or personal) this student has not seen yet
     banner_notification = None
-    if unseen_notifications:
-        # Show the oldest unseen notification
-        oldest_note = unseen_notifications[0]
+    oldest_note = pop_unseen_notification(current_user.id, profile.student_class)
+    if oldest_note:
         banner_notification = oldest_note.message
-        oldest_note.seen = True
         db.session.commit()
 
-    # Check for new learning resource notification
-    resource_notification = Notification.query.filter(
-        Notification.user_id == None,
-        Notification.message == 'New learning resource is available now'
-    ).order_by(Notification.created_at.desc()).first()
+    # Newest learning resource announcement the student has not seen yet
+    # (shown once: a receipt is recorded like for the banner above)
+    resource_notification = pop_latest_unread_notification(current_user.id, profile.student_class, 'resource')
+    if resource_notification:
+        db.session.commit()
     
     return render_template('student/home.html', admin_notification=banner_notification, profile=profile, resource_notification=resource_notification)
 
@@ -157,22 +151,32 @@ def profile():
 @student_bp.route('/notifications')
 @login_required
 def notifications():
-    cutoff = datetime.now() - timedelta(days=15)
-    # Delete old notifications
-    Notification.query.filter(Notification.created_at < cutoff).delete(synchronize_session=False)
-    db.session.commit()
     notif_type = request.args.get('type', 'class')
     profile = Profile.query.filter_by(user_id=current_user.id).first()
-    if notif_type == 'my':
-        notifications = Notification.query.filter(Notification.user_id == current_user.id, Notification.created_at >= cutoff).order_by(Notification.created_at.desc()).all()
-    else:
-        notifications = Notification.query.filter(
-            Notification.user_id == None,
-            (Notification.class_for == 'all') | (Notification.class_for == profile.student_class),
-            Notification.created_at >= cutoff
-        ).order_by(Notification.created_at.desc()).all()
-    # Show all messages, seen and unseen, newest 10 as cards, rest as table
-    return render_template('student/notifications.html', notifications=notifications, notif_type=notif_type)
+    page = get_notifications_page(
+        current_user.id, profile.student_class,
+        personal=(notif_type == 'my'),
+        after=request.args.get('after'),
+        limit=current_app.config.get('NOTIFICATIONS_PAGE_SIZE', 30)
+    )
+    # Opening a tab marks its notifications as read
+    if not request.args.get('after') and mark_notifications_read(current_user.id, profile.student_class, personal=(notif_type == 'my')):
+        db.session.commit()
+    # Newest 10 of the page as cards, the rest as a table
+    return render_template('student/notifications.html',
+                         notifications=page['notifications'],
+                         next_cursor=page['next_cursor'],
+                         is_first_page=not request.args.get('after'),
+                         notif_type=notif_type)
+
+@student_bp.route('/notifications/unread')
+@login_required
+def unread_notifications():
+    # Nav badge; counted once and then kept in the cache, see get_unread_notification_count()
+    profile = current_user.profile
+    if current_user.is_admin or not profile:
+        return jsonify({'count': 0})
+    return jsonify({'count': get_unread_notification_count(current_user.id, profile.student_class)})
 
 @student_bp.route('/pdfs')
 @login_required
@@ -184,23 +188,31 @@ def pdfs():
 @student_bp.route('/fee', methods=['GET', 'POST'])
 @login_required
 def fee():
-    # Get all fees for the student
-    all_fees = Fee.query.filter_by(user_id=current_user.id).order_by(Fee.month.desc()).all()
-    outstanding_fees = [fee for fee in all_fees if not fee.is_paid]
-    paid_fees = [fee for fee in all_fees if fee.is_paid]
-    
-    # Calculate total due
-    total_due = sum(fee.amount_due for fee in outstanding_fees)
-    
-    # Get payment history
-    payments = Payment.query.filter_by(user_id=current_user.id).join(Fee).order_by(Payment.requested_at.desc()).all()
-    
-    return render_template('student/fee.html', 
-                         all_fees=all_fees,
-                         outstanding_fees=outstanding_fees,
-                         paid_fees=paid_fees,
-                         total_due=total_due,
-                         payments=payments)
+    # Conditional GET: the page only changes when a fee or payment of this student does.
+    # Pending flash messages are rendered into the page, so those responses get no validator.
+    etag, last_modified = get_fee_page_validator(current_user.id)
+    if session.get('_flashes'):
+        etag = None
+    if etag and request.method == 'GET':
+        not_modified = etag in request.if_none_match if request.if_none_match else (
+            last_modified is not None and request.if_modified_since is not None
+            and request.if_modified_since >= last_modified
+        )
+        if not_modified:
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+    page = get_student_fee_page(current_user.id)
+    response = make_response(render_template('student/fee.html', **page))
+    if etag:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
 
 @student_bp.route('/cash_payment/<int:fee_id>', methods=['GET', 'POST'])
 @login_required
@@ -222,6 +234,10 @@ def cash_payment(fee_id):
             is_confirmed=False
         )
         db.session.add(payment)
+        db.session.flush()
+        record_payment_events('requested', [payment.id], current_user.id)
+        adjust_pending_approvals(1)
+        invalidate_on_commit(FEE_SUMMARY_CACHE_PREFIX)
         db.session.commit()
         
         flash('Cash payment request submitted successfully! Please pay the amount to your teacher.', 'success')
@@ -265,6 +281,9 @@ def upi_payment(fee_id):
         if not upi_reference:
             flash('Please provide the UPI reference number.', 'danger')
             return redirect(url_for('student.upi_payment', fee_id=fee_id))
+        if find_duplicate_reference(upi_reference):
+            flash('This UPI reference number has already been submitted. Please check it and try again, or contact the admin.', 'danger')
+            return redirect(url_for('student.upi_payment', fee_id=fee_id))
         # Create UPI payment request (requires admin approval)
         payment = Payment(
             user_id=current_user.id,
@@ -274,6 +293,10 @@ def upi_payment(fee_id):
             is_confirmed=False
         )
         db.session.add(payment)
+        db.session.flush()
+        record_payment_events('requested', [payment.id], current_user.id)
+        adjust_pending_approvals(1)
+        invalidate_on_commit(FEE_SUMMARY_CACHE_PREFIX)
         db.session.commit()
         flash('UPI payment request submitted successfully! Admin will verify and approve your payment.', 'success')
         return redirect(url_for('student.fee'))
@@ -348,6 +371,7 @@ def test_update():
                 marks_obtained=marks_obtained
             )
             db.session.add(mark)
+            invalidate_leaderboard(profile.student_class)
             db.session.commit()
             
             # Log successful submission
@@ -383,14 +407,30 @@ def test_csrf():
 @student_bp.route('/class_notifications')
 @login_required
 def class_notifications():
-    notifications = Notification.query.filter(Notification.user_id == None).order_by(Notification.created_at.desc()).all()
-    return render_template('student/classnotific.html', notifications=notifications)
+    profile = Profile.query.filter_by(user_id=current_user.id).first()
+    student_class = profile.student_class if profile else None
+    page = get_notifications_page(
+        current_user.id, student_class,
+        after=request.args.get('after'),
+        limit=current_app.config.get('NOTIFICATIONS_PAGE_SIZE', 30)
+    )
+    return render_template('student/classnotific.html',
+                         notifications=page['notifications'],
+                         next_cursor=page['next_cursor'],
+                         is_first_page=not request.args.get('after'))
 
 @student_bp.route('/my_notifications')
 @login_required
 def my_notifications():
-    notifications = Notification.query.filter(Notification.user_id == current_user.id).order_by(Notification.created_at.desc()).all()
-    return render_template('student/mynotifications.html', notifications=notifications)
+    page = get_notifications_page(
+        current_user.id, None, personal=True,
+        after=request.args.get('after'),
+        limit=current_app.config.get('NOTIFICATIONS_PAGE_SIZE', 30)
+    )
+    return render_template('student/mynotifications.html',
+                         notifications=page['notifications'],
+                         next_cursor=page['next_cursor'],
+                         is_first_page=not request.args.get('after'))
 
 @student_bp.route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
@@ -447,8 +487,9 @@ def drop_request():
     if current_user.is_admin:
         return redirect(url_for('admin.home1'))
     profile = Profile.query.filter_by(user_id=current_user.id).first()
-    dues = Fee.query.filter_by(user_id=current_user.id, is_paid=False).all()
-    total_due = sum(fee.amount_due for fee in dues)
+    balance = StudentBalance.query.get(current_user.id)
+    total_due = balance.total_due if balance else 0
+    dues = Fee.query.filter_by(user_id=current_user.id, is_paid=False).order_by(Fee.period).all() if total_due else []
     existing_request = DropoutRequest.query.filter_by(user_id=current_user.id, status='pending').first()
     if request.method == 'POST':
         if total_due > 0:
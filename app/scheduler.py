@@ -0,0 +1,168 @@
+"""
+Lightweight in-process scheduler for the monthly fee jobs and daily housekeeping.
+
+Each job runs at most once per period (a month, or a day for "* HH:MM" schedules).
+A run is claimed by inserting its (job, period_key) row into scheduled_runs; the unique
+key means only one web worker or cron invocation can win a given period, however many
+are running.
+Failed runs are marked as such and are claimed again on the next tick, as are runs
+left 'running' past SCHEDULER_STALE_RUN_SECONDS.
+"""
+from app import db, socketio
+from app.models import ScheduledRun
+from datetime import timedelta
+from flask import current_app
+from app.utils import assign_monthly_dues, check_monthly_fee_notifications, purge_old_notifications, dialect_insert, get_current_time_ist
+
+
+def _monthly_dues():
+    result = assign_monthly_dues()
+    return f'added {result["added"]}, skipped {result["skipped"]}'
+
+
+def _fee_reminders():
+    return f'reminded {check_monthly_fee_notifications()} students'
+
+
+def _notification_purge():
+    deleted = purge_old_notifications(
+        current_app.config.get('NOTIFICATION_RETENTION_DAYS', 15),
+        current_app.config.get('NOTIFICATION_PURGE_BATCH_SIZE', 1000)
+    )
+    return f'deleted {deleted} notifications'
+
+
+# job name -> (config key holding the "<day of month> <HH:MM>" IST schedule, callable)
+JOBS = {
+    'monthly_dues': ('MONTHLY_DUES_SCHEDULE', _monthly_dues),
+    'fee_reminders': ('FEE_REMINDER_SCHEDULE', _fee_reminders),
+    'notification_purge': ('NOTIFICATION_PURGE_SCHEDULE', _notification_purge),
+}
+
+
+def parse_schedule(value):
+    """
+    Parse a '<day> <HH:MM>' schedule into (day, hour, minute); returns None if malformed.
+    A day of '*' means every day and is returned as None.
+    """
+    try:
+        day, clock = value.split()
+        hour, minute = (int(part) for part in clock.split(':'))
+        day = None if day == '*' else int(day)
+    except (AttributeError, ValueError):
+        return None
+    if not ((day is None or 1 <= day <= 28) and 0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    return day, hour, minute
+
+
+def is_due(schedule, now):
+    """True once the scheduled time of the current period (month, or day for '*') has passed"""
+    parsed = parse_schedule(schedule)
+    if not parsed:
+        return False
+    day, hour, minute = parsed
+    if day is None:
+        return (now.hour, now.minute) >= (hour, minute)
+    return (now.day, now.hour, now.minute) >= (day, hour, minute)
+
+
+def period_key_for(schedule, now):
+    """'YYYY-MM-DD' for daily schedules, 'YYYY-MM' otherwise"""
+    parsed = parse_schedule(schedule)
+    if parsed and parsed[0] is None:
+        return now.strftime('%Y-%m-%d')
+    return now.strftime('%Y-%m')
+
+
+def claim_run(job, period_key):
+    """
+    Claim a (job, period_key) run and return its id, or None if another run holds it.
+
+    A new row is inserted with ON CONFLICT DO NOTHING; an existing failed run, or a
+    'running' one older than SCHEDULER_STALE_RUN_SECONDS (its worker was killed or
+    redeployed mid-job), is taken over with a conditional UPDATE, so two claimers can
+    never both succeed.
+    """
+    now = get_current_time_ist()
+    stale_before = now - timedelta(seconds=current_app.config.get('SCHEDULER_STALE_RUN_SECONDS', 3600))
+    run_id = db.session.execute(
+        dialect_insert(ScheduledRun).values(
+            job=job, period_key=period_key, status='running', started_at=now
+        ).on_conflict_do_nothing(index_elements=['job', 'period_key']).returning(ScheduledRun.id)
+    ).scalar()
+    if run_id is None:
+        run_id = db.session.execute(
+            db.update(ScheduledRun).where(
+                ScheduledRun.job == job,
+                ScheduledRun.period_key == period_key,
+                db.or_(
+                    ScheduledRun.status == 'failed',
+                    db.and_(ScheduledRun.status == 'running', ScheduledRun.started_at < stale_before)
+                )
+            ).values(status='running', started_at=now, finished_at=None, detail=None).returning(ScheduledRun.id)
+        ).scalar()
+    db.session.commit()
+    return run_id
+
+
+def finish_run(run_id, status, detail=None):
+    db.session.execute(
+        db.update(ScheduledRun).where(ScheduledRun.id == run_id).values(
+            status=status, finished_at=get_current_time_ist(), detail=detail
+        )
+    )
+    db.session.commit()
+
+
+def run_job(app, job, period_key):
+    """Claim and run one job for a period; returns (status, detail) or None if already claimed"""
+    _, func = JOBS[job]
+    run_id = claim_run(job, period_key)
+    if run_id is None:
+        return None
+    try:
+        detail = func()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Scheduled job {job} for {period_key} failed: {str(e)}')
+        finish_run(run_id, 'failed', str(e))
+        return 'failed', str(e)
+    finish_run(run_id, 'done', detail)
+    app.logger.info(f'Scheduled job {job} for {period_key}: {detail}')
+    return 'done', detail
+
+
+def run_due_jobs(app, now=None, jobs=None, force=False):
+    """
+    Run every job whose schedule has passed this period and has not run yet.
+
+    `jobs` limits the run to the given names and `force` skips the schedule check
+    (the (job, period) claim still applies). Returns {job: (status, detail) or None}.
+    """
+    now = now or get_current_time_ist()
+    outcomes = {}
+    # url_for() in the jobs needs a request context outside of a web request
+    with app.test_request_context('/'):
+        for job in jobs or JOBS:
+            config_key, _ = JOBS[job]
+            schedule = app.config.get(config_key, '')
+            if force or is_due(schedule, now):
+                outcomes[job] = run_job(app, job, period_key_for(schedule, now))
+    return outcomes
+
+
+def _scheduler_loop(app):
+    interval = app.config.get('SCHEDULER_INTERVAL_SECONDS', 300)
+    while True:
+        try:
+            run_due_jobs(app)
+        except Exception as e:
+            app.logger.error(f'Scheduler tick failed: {str(e)}')
+        socketio.sleep(interval)
+
+
+def start_scheduler(app):
+    """Start the scheduler as a background task of the Socket.IO server"""
+    app.logger.info('Starting in-process scheduler')
+    return socketio.start_background_task(_scheduler_loop, app)
@@ -0,0 +1,50 @@
+"""
+Socket.IO event handlers.
+
+Browsers connect to the authenticated /live namespace. On connect the Flask-Login
+session decides which rooms the socket joins: admins join 'admins', students join
+'students', their own user room and their class room. Server code addresses
+those rooms through live_emit() and the room helpers below; delivery goes through
+the outbound queue in app/events.py.
+"""
+from flask_login import current_user
+from flask_socketio import join_room
+from app import socketio
+from app.events import outbound
+
+LIVE_NAMESPACE = '/live'
+ADMINS_ROOM = 'admins'
+STUDENTS_ROOM = 'students'
+
+
+def user_room(user_id):
+    return f'user_{user_id}'
+
+
+def class_room(student_class):
+    """Room for one class; 'all' (or no class) addresses every student"""
+    if not student_class or student_class == 'all':
+        return STUDENTS_ROOM
+    return f'class_{student_class}'
+
+
+def live_emit(event, data, to, latest_only=False):
+    """
+    Queue `event` on the /live namespace for a room or list of rooms. Use `latest_only`
+    for state such as counters, where only the newest payload per room matters.
+    """
+    outbound.put(event, data, to, namespace=LIVE_NAMESPACE, latest_only=latest_only)
+
+
+@socketio.on('connect', namespace=LIVE_NAMESPACE)
+def handle_connect(auth=None):
+    # Anonymous sockets are refused; there is nothing on this namespace for them
+    if not current_user.is_authenticated:
+        return False
+    if current_user.is_admin:
+        join_room(ADMINS_ROOM)
+        return
+    join_room(STUDENTS_ROOM)
+    join_room(user_room(current_user.id))
+    if current_user.profile:
+        join_room(class_room(current_user.profile.student_class))
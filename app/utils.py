@@ -1,6 +1,8 @@
-from datetime import datetime, date
-from app.models import Fee, Notification, Profile, User, Setting, Mark, PDF
-from app import db, socketio
+from datetime import datetime, date, timedelta
+from app.models import Fee, Payment, Notification, NotificationReceipt, Profile, User, Setting, Mark, PDF, StudentBalance, PaymentEvent, month_label_to_period, normalize_payment_reference
+from app import db
+from app.cache import cache, invalidate_on_commit, on_commit
+from app.sockets import live_emit, user_room, class_room, ADMINS_ROOM
 from flask import url_for
 import pytz
 from itsdangerous import URLSafeTimedSerializer
@@ -8,8 +10,11 @@ from flask import current_app
 from flask_mail import Message
 import os
 import hashlib
+import csv
+import io
 from werkzeug.utils import secure_filename
 import re
+import time
 
 def get_current_time_ist():
     """Get current time in Indian Standard Time (IST)"""
@@ -30,45 +35,248 @@ def get_fee_amount_for_class(student_class):
         return 0  # fallback
 
 def check_monthly_fee_notifications():
-    """Check if it's the 1st of the month and send fee notifications"""
-    # Use IST for date calculations
-    india_tz = pytz.timezone('Asia/Kolkata')
-    today = datetime.now(india_tz).date()
-    
-    # Check if it's the 1st of the month
-    if today.day == 1:
-        current_month = today.strftime('%B %Y')  # e.g., "July 2025"
-        
-        # Get all students
-        students = Profile.query.all()
-        
-        for student in students:
-            # Check if fee notification already sent for this month
-            existing_notification = Notification.query.filter_by(
-                user_id=student.user_id,
-                message=f"Fee due for {current_month}"
-            ).first()
-            
-            if not existing_notification:
-                # Create fee notification
-                notification = Notification(
-                    user_id=student.user_id,
-                    message=f"Fee due for {current_month}"
-                )
-                db.session.add(notification)
-                
-                # Send real-time popup notification
-                socketio.emit('fee_notification', {
-                    'message': f'Fee due for {current_month}',
-                    'url': url_for('student.fee'),
-                    'button': 'Pay Now'
-                }, room=f'student_{student.user_id}')
-        
+    """
+    Remind every student with an unpaid due for the current month.
+
+    Run by the scheduler (see app/scheduler.py), which records one run per month, so
+    no per-student lookup of earlier reminder messages is needed here.
+    Returns the number of students reminded.
+    """
+    current_month = get_current_time_ist().strftime('%B %Y')  # e.g., "July 2025"
+    user_ids = [row.user_id for row in db.session.query(Fee.user_id).filter(
+        Fee.period == month_label_to_period(current_month),
+        Fee.is_paid.is_not(True)
+    ).distinct()]
+
+    if user_ids:
+        db.session.execute(db.insert(Notification), [
+            {'user_id': user_id, 'message': f"Fee due for {current_month}", 'kind': 'fee_reminder'} for user_id in user_ids
+        ])
+        count_new_notification(user_ids=user_ids)
+    db.session.commit()
+
+    if user_ids:
+        # Send real-time popup notification
+        try:
+            live_emit('fee_notification', {
+                'message': f'Fee due for {current_month}',
+                'url': url_for('student.fee'),
+                'button': 'Pay Now'
+            }, to=[user_room(user_id) for user_id in user_ids])
+        except Exception as e:
+            current_app.logger.error(f'Error sending real-time fee reminder: {str(e)}')
+    return len(user_ids)
+
+UNREAD_NOTIFICATIONS_CACHE_PREFIX = 'notifications:unread:'
+UNREAD_GENERATION_CACHE_PREFIX = 'notifications:generation:'
+
+def notification_cutoff():
+    """Oldest created_at still shown to students; older rows wait for the purge job"""
+    return get_current_time_ist().replace(tzinfo=None) - timedelta(days=current_app.config.get('NOTIFICATION_RETENTION_DAYS', 15))
+
+def _addressed_to(user_id, student_class):
+    """Notifications for this student: personal ones, their class's and everyone's"""
+    return db.or_(
+        Notification.user_id == user_id,
+        db.and_(Notification.user_id == None, Notification.class_for.in_(['all', student_class]))
+    )
+
+def _unread_by(user_id):
+    return ~db.exists().where(
+        NotificationReceipt.user_id == user_id, NotificationReceipt.notification_id == Notification.id
+    )
+
+def pop_unseen_notification(user_id, student_class):
+    """
+    Return the oldest notification addressed to this student (personally, to their
+    class or to everyone) that they have not been shown yet, and record a receipt for
+    it. The lookup is an anti-join against the student's notification_receipts rows,
+    so other students' views never affect this queue. The caller commits.
+    """
+    note = Notification.query.filter(
+        _addressed_to(user_id, student_class),
+        Notification.created_at >= notification_cutoff(),
+        _unread_by(user_id)
+    ).order_by(Notification.created_at.asc(), Notification.id.asc()).first()
+    if note is not None:
+        _record_receipt(user_id, student_class, note.id)
+    return note
+
+def pop_latest_unread_notification(user_id, student_class, kind):
+    """
+    Return the newest class-wide notification of `kind` for this student that they have
+    not seen, and record a receipt for it so it is shown only once. The caller commits.
+    """
+    note = Notification.query.filter(
+        Notification.user_id == None,
+        Notification.class_for.in_(['all', student_class]),
+        Notification.kind == kind,
+        Notification.created_at >= notification_cutoff(),
+        _unread_by(user_id)
+    ).order_by(Notification.created_at.desc(), Notification.id.desc()).first()
+    if note is not None:
+        _record_receipt(user_id, student_class, note.id)
+    return note
+
+def _record_receipt(user_id, student_class, notification_id):
+    result = db.session.execute(
+        dialect_insert(NotificationReceipt).values(
+            user_id=user_id, notification_id=notification_id, seen_at=get_current_time_ist()
+        ).on_conflict_do_nothing(index_elements=['user_id', 'notification_id'])
+    )
+    adjust_unread_notifications(user_id, student_class, -result.rowcount)
+
+def mark_notifications_read(user_id, student_class, personal=None):
+    """
+    Record receipts for every unread notification of this student in one INSERT ... SELECT.
+    `personal` limits it to personal (True) or class-wide (False) notifications.
+    Returns the number marked; the caller commits.
+    """
+    query = db.select(db.literal(user_id), Notification.id, db.literal(get_current_time_ist())).where(
+        _addressed_to(user_id, student_class),
+        Notification.created_at >= notification_cutoff(),
+        _unread_by(user_id)
+    )
+    if personal is not None:
+        query = query.where(Notification.user_id == user_id if personal else Notification.user_id == None)
+    result = db.session.execute(
+        dialect_insert(NotificationReceipt).from_select(['user_id', 'notification_id', 'seen_at'], query)
+        .on_conflict_do_nothing(index_elements=['user_id', 'notification_id'])
+    )
+    adjust_unread_notifications(user_id, student_class, -result.rowcount)
+    return result.rowcount
+
+def _unread_counter_key(user_id, student_class):
+    """
+    Cache key of a student's unread counter. It embeds the generations of their class
+    and of 'all', so a new class-wide notification retires every counter of the class
+    with one write instead of one per student.
+    """
+    generations = [cache.get(f'{UNREAD_GENERATION_CACHE_PREFIX}{key}') or 0 for key in ('all', student_class)]
+    return f'{UNREAD_NOTIFICATIONS_CACHE_PREFIX}{user_id}:{generations[0]}.{generations[1]}'
+
+def get_unread_notification_count(user_id, student_class):
+    """
+    Number of notifications addressed to this student that they have not seen.
+
+    Served from the shared cache; the database is only counted when the counter is
+    missing or its class generation has moved on, and adjust_unread_notifications()
+    keeps it current in between.
+    """
+    key = _unread_counter_key(user_id, student_class)
+    count = cache.get(key)
+    if count is None:
+        count = db.session.query(db.func.count(Notification.id)).filter(
+            _addressed_to(user_id, student_class),
+            Notification.created_at >= notification_cutoff(),
+            _unread_by(user_id)
+        ).scalar()
+        cache.set(key, count, current_app.config.get('UNREAD_NOTIFICATIONS_CACHE_SECONDS', 3600))
+    return count
+
+def adjust_unread_notifications(user_id, student_class, delta):
+    """
+    Add `delta` to the cached unread counter of one student once the current transaction
+    commits, and push the new count to their Socket.IO room. A counter that is not
+    cached is left alone; it is counted on the next read.
+    """
+    if not delta:
+        return
+
+    def apply():
+        count = cache.incr(_unread_counter_key(user_id, student_class), delta)
+        if count is not None:
+            live_emit('unread_notifications', {'count': max(count, 0)}, to=user_room(user_id), latest_only=True)
+
+    on_commit(apply)
+
+def count_new_notification(class_for=None, user_ids=None):
+    """
+    Retire the unread counters of the students a new notification is addressed to.
+
+    Once the transaction commits, the generation of each affected class is bumped and a
+    single 'unread_changed' event goes to the class room (or to the addressed students'
+    rooms for personal notifications); clients then refetch their count.
+    """
+    if user_ids is None:
+        classes = [class_for or 'all']
+        rooms = class_room(class_for)
+    else:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        classes = [row.student_class for row in db.session.query(Profile.student_class).filter(
+            Profile.user_id.in_(user_ids)
+        ).distinct()]
+        rooms = [user_room(user_id) for user_id in user_ids]
+
+    def apply():
+        for student_class in classes:
+            cache.set(f'{UNREAD_GENERATION_CACHE_PREFIX}{student_class}', time.time_ns())
+        live_emit('unread_changed', {}, to=rooms)
+
+    on_commit(apply)
+
+def get_notifications_page(user_id, student_class, personal=False, after=None, limit=30):
+    """
+    Fetch one page of a student's notifications, newest first.
+
+    `personal` selects their own notifications instead of the ones for their class and
+    for everyone. Rows are ordered by (created_at, id) descending and `after` is the
+    cursor of the last row of the previous page, so each page is an index range scan.
+    """
+    query = db.session.query(
+        Notification.id, Notification.message, Notification.created_at, Notification.class_for, Notification.kind
+    ).filter(Notification.created_at >= notification_cutoff())
+    if personal:
+        query = query.filter(Notification.user_id == user_id)
+    else:
+        query = query.filter(Notification.user_id == None, Notification.class_for.in_(['all', student_class]))
+
+    cursor = decode_cursor(after, datetime.fromisoformat, int)
+    if cursor:
+        cursor_created_at, cursor_id = cursor
+        query = query.filter(db.or_(
+            Notification.created_at < cursor_created_at,
+            db.and_(Notification.created_at == cursor_created_at, Notification.id < cursor_id)
+        ))
+    rows = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+    return {'notifications': rows, 'next_cursor': next_cursor}
+
+def purge_old_notifications(max_age_days=15, batch_size=1000):
+    """
+    Delete notifications older than `max_age_days`, with their read receipts.
+
+    Rows are removed in batches of `batch_size` ids, each in its own short transaction,
+    so a large backlog never holds a long lock on the notifications table.
+    Returns the number of notifications deleted.
+    """
+    # created_at holds the IST wall clock, so compare against a naive IST cutoff
+    cutoff = get_current_time_ist().replace(tzinfo=None) - timedelta(days=max_age_days)
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(Notification.id).filter(
+            Notification.created_at < cutoff
+        ).order_by(Notification.id).limit(batch_size)]
+        if not ids:
+            return deleted
+        db.session.execute(db.delete(NotificationReceipt).where(NotificationReceipt.notification_id.in_(ids)))
+        db.session.execute(db.delete(Notification).where(Notification.id.in_(ids)))
+        # Unread counters may include the deleted rows; recount them on the next read
+        invalidate_on_commit(UNREAD_NOTIFICATIONS_CACHE_PREFIX)
         db.session.commit()
+        deleted += len(ids)
 
 def get_fee_status_for_student(user_id):
     """Get fee status for a specific student"""
-    fees = Fee.query.filter_by(user_id=user_id).order_by(Fee.month.desc()).all()
+    fees = Fee.query.filter_by(user_id=user_id).order_by(Fee.period.desc().nulls_last(), Fee.id.desc()).all()
     
     outstanding_fees = [fee for fee in fees if not fee.is_paid]
     paid_fees = [fee for fee in fees if fee.is_paid]
@@ -81,80 +289,801 @@ def get_fee_status_for_student(user_id):
         'total_fees': len(fees)
     }
 
+def get_student_fee_page(user_id):
+    """
+    Load a student's fees and the payments made against them with one LEFT JOIN.
+
+    Fees come back newest period first; payments are attached to their fee in the
+    identity map, so templates can read payment.fee without further queries.
+    """
+    rows = db.session.query(Fee, Payment).outerjoin(Payment, Payment.fee_id == Fee.id).filter(
+        Fee.user_id == user_id
+    ).order_by(Fee.period.desc().nulls_last(), Fee.id.desc()).all()
+
+    all_fees = list(dict.fromkeys(fee for fee, _ in rows))
+    payments = sorted(
+        (payment for _, payment in rows if payment is not None),
+        key=lambda payment: (payment.requested_at or datetime.min, payment.id), reverse=True
+    )
+    outstanding_fees = [fee for fee in all_fees if not fee.is_paid]
+    return {
+        'all_fees': all_fees,
+        'outstanding_fees': outstanding_fees,
+        'paid_fees': [fee for fee in all_fees if fee.is_paid],
+        'total_due': sum(fee.amount_due for fee in outstanding_fees),
+        'payments': payments,
+        'pending_fee_ids': {payment.fee_id for payment in payments if not payment.is_confirmed}
+    }
+
+def get_fee_page_validator(user_id):
+    """
+    Return (etag, last_modified) for a student's fee page from one indexed lookup.
+
+    Every fee change refreshes student_balances.updated_at and every payment change
+    appends a payment event, so the later of the two marks the last change. The
+    profile fields shown on the page are folded into the ETag as well.
+    """
+    last_event = db.session.query(db.func.max(PaymentEvent.created_at)).filter(
+        PaymentEvent.user_id == user_id
+    ).scalar_subquery()
+    row = db.session.query(
+        Profile.full_name, Profile.student_class, StudentBalance.updated_at, last_event.label('last_event')
+    ).outerjoin(StudentBalance, StudentBalance.user_id == Profile.user_id).filter(Profile.user_id == user_id).first()
+    if row is None:
+        return None, None
+
+    changes = [value for value in (row.updated_at, row.last_event) if value is not None]
+    last_modified = None
+    if changes:
+        # Stored as IST wall time; HTTP dates are UTC
+        last_modified = max(changes)
+        if last_modified.tzinfo is None:
+            last_modified = pytz.timezone('Asia/Kolkata').localize(last_modified)
+        last_modified = last_modified.astimezone(pytz.utc).replace(microsecond=0)
+    fingerprint = f'{user_id}|{row.full_name}|{row.student_class}|{row.updated_at}|{row.last_event}'
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest(), last_modified
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page into an opaque keyset cursor"""
+    return '~'.join(str(value) for value in values)
+
+def decode_cursor(cursor, *types):
+    """Decode a keyset cursor into a tuple using the given types; returns None if it is missing or malformed"""
+    if not cursor:
+        return None
+    parts = cursor.split('~')
+    if len(parts) != len(types):
+        return None
+    try:
+        return tuple(cast(part) for cast, part in zip(types, parts))
+    except (TypeError, ValueError):
+        return None
+
+def get_feedues_report(selected_class='all', after=None, limit=50):
+    """
+    Build the fee dues report with one statement.
+
+    Fees are grouped per student with conditional aggregates (due count, total due,
+    total paid and the outstanding months). Window functions over the grouped rows
+    add the class-wide totals and each student's rank before the keyset filter, so
+    every row carries them and numbering continues across pages.
+    Rows are ordered by (due_count, total_due, profile id) descending; `after` is the
+    cursor of the last row of the previous page.
+    """
+    unpaid = Fee.is_paid.is_not(True)
+    outstanding_entry = (
+        db.func.coalesce(db.cast(Fee.period, db.String), '') + '|' + Fee.month + '|' + db.cast(Fee.amount_due, db.String)
+    )
+    grouped = db.session.query(
+        Profile.id.label('id'),
+        Profile.user_id,
+        Profile.full_name,
+        Profile.roll_number,
+        Profile.student_class,
+        Profile.profile_pic,
+        db.func.count(Fee.id).filter(unpaid).label('due_count'),
+        db.func.coalesce(db.func.sum(Fee.amount_due).filter(unpaid), 0).label('total_due'),
+        db.func.coalesce(db.func.sum(Fee.amount_due).filter(Fee.is_paid == True), 0).label('total_paid'),
+        db.func.aggregate_strings(outstanding_entry, ';').filter(unpaid).label('outstanding')
+    ).outerjoin(Fee, Fee.user_id == Profile.user_id)
+    if selected_class != 'all':
+        grouped = grouped.filter(Profile.student_class == selected_class)
+    grouped = grouped.group_by(Profile.id).subquery()
+
+    ranked = db.session.query(
+        grouped,
+        db.func.count().over().label('total_students'),
+        db.func.count().filter(grouped.c.due_count > 0).over().label('students_with_dues'),
+        db.func.coalesce(db.func.sum(grouped.c.total_due).over(), 0).label('total_outstanding'),
+        db.func.row_number().over(
+            order_by=(grouped.c.due_count.desc(), grouped.c.total_due.desc(), grouped.c.id.desc())
+        ).label('rank')
+    ).subquery()
+
+    page = db.session.query(ranked)
+    cursor = decode_cursor(after, int, int, int)
+    if cursor:
+        page = page.filter(db.tuple_(ranked.c.due_count, ranked.c.total_due, ranked.c.id) < db.tuple_(*cursor))
+    rows = page.order_by(
+        ranked.c.due_count.desc(), ranked.c.total_due.desc(), ranked.c.id.desc()
+    ).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    students_with_dues_list = []
+    students_paid_up_list = []
+    for row in rows:
+        if row.due_count:
+            outstanding = sorted(entry.split('|', 2) for entry in (row.outstanding or '').split(';') if entry)
+            students_with_dues_list.append({
+                'profile': row,
+                'outstanding_fees': [{'month': month, 'amount_due': int(amount)} for _, month, amount in outstanding],
+                'due_count': row.due_count,
+                'total_due': row.total_due,
+                'rank': row.rank
+            })
+        else:
+            students_paid_up_list.append({'profile': row, 'total_paid': row.total_paid})
+
+    totals = rows[0] if rows else None
+    return {
+        'students_with_dues_list': students_with_dues_list,
+        'students_paid_up_list': students_paid_up_list,
+        'total_students': totals.total_students if totals else 0,
+        'students_with_dues': totals.students_with_dues if totals else 0,
+        'total_outstanding': totals.total_outstanding if totals else 0,
+        'next_cursor': encode_cursor(rows[-1].due_count, rows[-1].total_due, rows[-1].id) if has_more else None
+    }
+
+def get_dues_page(student_class='all', period=None, paid=None, student=None, after=None, limit=50):
+    """
+    Fetch one page of dues for the admin dues listing.
+
+    Only the columns the listing shows are selected. Rows are ordered by (period, fee
+    id) descending with undated fees last, and `after` is the cursor of the last row
+    of the previous page, so the cost of a page depends on its size rather than on the
+    whole fee history. `student` matches a name fragment, registration or roll number.
+    """
+    query = db.session.query(
+        Fee.id, Fee.user_id, Fee.month, Fee.period, Fee.amount_due, Fee.is_paid,
+        Profile.full_name, Profile.roll_number, Profile.student_class
+    ).join(Profile, Profile.user_id == Fee.user_id)
+    if student_class and student_class != 'all':
+        query = query.filter(Profile.student_class == student_class)
+    if period:
+        query = query.filter(Fee.period == period)
+    if paid is not None:
+        query = query.filter(Fee.is_paid == True if paid else Fee.is_paid.is_not(True))
+    if student:
+        matches = [Profile.full_name.ilike(f'%{student}%'), Profile.reg_no == student]
+        if student.isdigit():
+            matches.append(Profile.roll_number == int(student))
+        query = query.filter(db.or_(*matches))
+
+    cursor = decode_cursor(after, str, int)
+    if cursor:
+        cursor_period, cursor_id = cursor
+        if cursor_period:
+            cursor_period = month_label_to_period(cursor_period)
+            query = query.filter(db.or_(
+                Fee.period < cursor_period,
+                db.and_(Fee.period == cursor_period, Fee.id < cursor_id),
+                Fee.period.is_(None)
+            ))
+        else:
+            query = query.filter(Fee.period.is_(None), Fee.id < cursor_id)
+    rows = query.order_by(Fee.period.desc().nulls_last(), Fee.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.period.strftime('%Y-%m') if last.period else '', last.id)
+    return {'dues': rows, 'next_cursor': next_cursor}
+
+FEE_LEDGER_COLUMNS = [
+    'fee_id', 'reg_no', 'student_name', 'student_class', 'roll_number', 'month', 'period',
+    'amount_due', 'is_paid', 'payment_id', 'payment_method', 'payment_reference',
+    'payment_confirmed', 'requested_at', 'confirmed_at'
+]
+
+def iter_fee_ledger_csv(student_class=None, from_period=None, to_period=None, paid=None, batch_size=1000):
+    """
+    Yield the fee and payment ledger as CSV text, one line at a time.
+
+    Fees are joined to the student's profile and to every payment made against them
+    (one line per payment, or a single line when there is none). Rows are fetched in
+    batches of `batch_size` through a server-side cursor, so memory stays flat
+    regardless of history size. `paid` is True/False to filter on the paid flag.
+    """
+    query = db.session.query(
+        Fee.id, Profile.reg_no, Profile.full_name, Profile.student_class, Profile.roll_number,
+        Fee.month, Fee.period, Fee.amount_due, Fee.is_paid,
+        Payment.id, Payment.method, Payment.reference, Payment.is_confirmed,
+        Payment.requested_at, Payment.confirmed_at
+    ).outerjoin(
+        Profile, Profile.user_id == Fee.user_id
+    ).outerjoin(
+        Payment, Payment.fee_id == Fee.id
+    )
+    if student_class and student_class != 'all':
+        query = query.filter(Profile.student_class == student_class)
+    if from_period:
+        query = query.filter(Fee.period >= from_period)
+    if to_period:
+        query = query.filter(Fee.period <= to_period)
+    if paid is not None:
+        query = query.filter(Fee.is_paid == paid)
+    query = query.order_by(Fee.period, Fee.id, Payment.id).execution_options(yield_per=batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    writer.writerow(FEE_LEDGER_COLUMNS)
+    yield flush()
+    for row in query:
+        writer.writerow([_csv_cell(value) for value in row])
+        yield flush()
+
+def _csv_cell(value):
+    """Format one ledger value, neutralising text that spreadsheets would treat as a formula"""
+    if value is None:
+        return ''
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+FEE_SUMMARY_CACHE_PREFIX = 'fee_summary:'
+
+def get_fee_month_summary(selected_class, period):
+    """
+    Return the fee management summary for one class and month.
+
+    Students, their fee for the month, the latest payment method and the class totals
+    (window aggregates) plus the month-wide due count and the monthly due setting
+    (scalar subqueries) all come back in one statement. The result is plain
+    data cached for FEE_SUMMARY_CACHE_SECONDS and dropped when fees or payments change.
+    """
+    key = f'{FEE_SUMMARY_CACHE_PREFIX}{selected_class}:{period.isoformat()}'
+    summary = cache.get(key)
+    if summary is not None:
+        return summary
+
+    month_fee = db.aliased(Fee)
+    latest_payment = db.session.query(Payment).filter(Payment.fee_id == Fee.id).order_by(Payment.id.desc()).limit(1)
+    month_dues = db.session.query(db.func.count(month_fee.id)).filter(month_fee.period == period).scalar_subquery()
+    monthly_due_setting = db.session.query(Setting.value).filter(Setting.key == 'monthly_due_amount').scalar_subquery()
+    unpaid = (Fee.id != None) & Fee.is_paid.is_not(True)
+
+    rows = db.session.query(
+        Profile.user_id,
+        Profile.full_name,
+        Profile.roll_number,
+        Profile.student_class,
+        Profile.profile_pic,
+        Fee.id.label('fee_id'),
+        Fee.month,
+        Fee.amount_due,
+        Fee.is_paid,
+        latest_payment.with_entities(Payment.method).scalar_subquery().label('payment_method'),
+        latest_payment.with_entities(Payment.requested_at).scalar_subquery().label('payment_requested_at'),
+        db.func.count().over().label('total_students'),
+        db.func.coalesce(db.func.sum(Fee.amount_due).over(), 0).label('total_fees'),
+        db.func.coalesce(db.func.sum(Fee.amount_due).filter(unpaid).over(), 0).label('total_outstanding'),
+        db.func.count(Fee.id).filter(unpaid).over().label('students_with_dues'),
+        month_dues.label('current_month_dues'),
+        monthly_due_setting.label('monthly_due_setting')
+    ).outerjoin(
+        Fee, (Fee.user_id == Profile.user_id) & (Fee.period == period)
+    ).filter(
+        Profile.student_class == selected_class
+    ).order_by(Profile.roll_number).all()
+
+    if rows:
+        totals = rows[0]
+    else:
+        # Empty class: only the month-wide figures are needed
+        totals = db.session.query(
+            db.literal(0).label('total_students'),
+            db.literal(0).label('total_fees'),
+            db.literal(0).label('total_outstanding'),
+            db.literal(0).label('students_with_dues'),
+            month_dues.label('current_month_dues'),
+            monthly_due_setting.label('monthly_due_setting')
+        ).one()
+
+    setting_value = totals.monthly_due_setting
+    summary = {
+        'students': [row._asdict() for row in rows],
+        'fees': [row._asdict() for row in rows if row.fee_id is not None],
+        'students_with_dues_list': [row._asdict() for row in rows if row.fee_id is not None and not row.is_paid],
+        'total_students': totals.total_students,
+        'total_fees': totals.total_fees,
+        'total_outstanding': totals.total_outstanding,
+        'students_with_dues': totals.students_with_dues,
+        'current_month_dues': totals.current_month_dues,
+        'current_monthly_amount': int(setting_value) if setting_value and setting_value.isdigit() else 1500
+    }
+    cache.set(key, summary, current_app.config.get('FEE_SUMMARY_CACHE_SECONDS', 30))
+    return summary
+
+PENDING_APPROVALS_CACHE_KEY = 'pending_approvals'
+
 def get_pending_approvals_count():
-    """Get count of pending payment approvals (both Cash and UPI)"""
-    from app.models import Payment
-    return Payment.query.filter_by(is_confirmed=False).count()
+    """
+    Get count of pending payment approvals (both Cash and UPI).
 
-def assign_monthly_dues():
+    Served from the shared cache; the database is only counted when the counter is
+    missing (first read, expiry after PENDING_APPROVALS_CACHE_SECONDS, or after an
+    invalidation), and adjust_pending_approvals() keeps it current in between.
     """
-    Assign monthly dues for all students for the current month.
-    This function is called manually by the admin when they click the "Assign Monthly Dues" button.
-    Dues are assigned based on the current date/time when the button is clicked.
-    Also sends notifications to all students about the new dues.
-    
-    Month-based amount locking: Each month gets locked to the amount that was set when
-    dues were first assigned for that month. New students joining that month get the same amount.
+    count = cache.get(PENDING_APPROVALS_CACHE_KEY)
+    if count is None:
+        count = db.session.query(db.func.count(Payment.id)).filter(Payment.is_confirmed == False).scalar()
+        cache.set(PENDING_APPROVALS_CACHE_KEY, count, current_app.config.get('PENDING_APPROVALS_CACHE_SECONDS', 3600))
+    return count
+
+def adjust_pending_approvals(delta):
     """
-    now = get_current_time_ist()
-    current_month_label = now.strftime('%B %Y')
-    
-    # Check if dues already exist for this month to determine the locked amount
-    existing_dues = Fee.query.filter_by(month=current_month_label).first()
-    
-    if existing_dues:
-        # Month already has dues - use the locked amount from existing dues
-        locked_amount = existing_dues.amount_due
-        current_app.logger.info(f'Using locked amount for {current_month_label}: ₹{locked_amount}')
+    Add `delta` to the pending approvals counter once the current transaction commits,
+    and push the new count to the admins' Socket.IO room
+    """
+    if not delta:
+        return
+
+    def apply():
+        count = cache.incr(PENDING_APPROVALS_CACHE_KEY, delta)
+        if count is None:
+            return  # not cached; the next read counts from the database
+        try:
+            live_emit('pending_approvals', {'count': count}, to=ADMINS_ROOM, latest_only=True)
+        except Exception as e:
+            current_app.logger.error(f'Error pushing pending approvals count: {str(e)}')
+
+    on_commit(apply)
+
+def dialect_insert(model):
+    """
+    Return an INSERT construct for the bound database dialect so callers can use
+    ON CONFLICT clauses on both PostgreSQL (production) and SQLite (development)
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
     else:
-        # New month - get amount from UPI settings and lock it for this month
-        monthly_due_setting = Setting.query.filter_by(key='monthly_due_amount').first()
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def refresh_student_balances(user_ids=None):
+    """
+    Recompute the student_balances rows for the given students (every student when None)
+    from their fee rows with one INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+    Call it before committing any fee change so the summary moves in the same transaction.
+    """
+    if user_ids is not None:
+        user_ids = {int(user_id) for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return
+    db.session.flush()
+    unpaid = Fee.is_paid.is_not(True)
+    totals = db.session.query(
+        User.id,
+        db.func.count(Fee.id).filter(unpaid),
+        db.func.coalesce(db.func.sum(Fee.amount_due).filter(unpaid), 0),
+        db.func.coalesce(db.func.sum(Fee.amount_due).filter(Fee.is_paid == True), 0),
+        db.literal(get_current_time_ist(), db.DateTime)
+    ).outerjoin(Fee, Fee.user_id == User.id).filter(User.is_admin == False)
+    if user_ids is not None:
+        totals = totals.filter(User.id.in_(user_ids))
+    totals = totals.group_by(User.id)
+    stmt = dialect_insert(StudentBalance).from_select(
+        ['user_id', 'due_count', 'total_due', 'total_paid', 'updated_at'], totals
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id'], set_={
+        'due_count': stmt.excluded.due_count,
+        'total_due': stmt.excluded.total_due,
+        'total_paid': stmt.excluded.total_paid,
+        'updated_at': stmt.excluded.updated_at
+    })
+    db.session.execute(stmt)
+    invalidate_on_commit(FEE_SUMMARY_CACHE_PREFIX)
+
+def bulk_assign_dues(month_label, amount, notification_message, dry_run=False):
+    """
+    Create the missing dues for every student for one month in a constant number of statements.
+
+    `amount` is either one amount for every student or a {student_class: amount} dict;
+    with a dict, students without a profile are left out. Missing fees are found with an anti-join
+    on existing fees and inserted with a single INSERT ... SELECT that skips conflicts
+    on the (user_id, period) unique constraint, so concurrent runs never double-assign.
+    Notifications for the newly assigned students are inserted in one batch.
+    With dry_run=True only the counting query runs and nothing is written.
+
+    Returns a dict with 'added', 'skipped', 'total_students', 'user_ids' and
+    'by_class' ({student_class: {'students': n, 'added': n}}).
+    """
+    period = month_label_to_period(month_label)
+    class_key = db.func.coalesce(Profile.student_class, 'unassigned')
+    existing_fee = db.aliased(Fee)
+    students = db.session.query(User.id).outerjoin(
+        Profile, Profile.user_id == User.id
+    ).outerjoin(
+        existing_fee, (existing_fee.user_id == User.id) & (existing_fee.period == period)
+    ).filter(User.is_admin == False)
+    if isinstance(amount, dict):
+        students = students.filter(Profile.id != None)
+        amount_expr = db.case(amount, value=Profile.student_class, else_=0)
+    else:
+        amount_expr = db.literal(amount)
+
+    # Per-class breakdown of eligible students and those still missing a due
+    class_counts = students.with_entities(
+        class_key.label('student_class'),
+        db.func.count(User.id).label('students'),
+        db.func.count(User.id).filter(existing_fee.id == None).label('missing')
+    ).group_by(class_key).all()
+    by_class = {row.student_class: {'students': row.students, 'added': row.missing} for row in class_counts}
+    total_students = sum(row.students for row in class_counts)
+
+    if dry_run:
+        would_add = sum(row.missing for row in class_counts)
+        return {
+            'added': would_add,
+            'skipped': total_students - would_add,
+            'total_students': total_students,
+            'user_ids': [],
+            'by_class': by_class
+        }
+
+    missing = students.filter(existing_fee.id == None).with_entities(
+        User.id,
+        db.literal(month_label),
+        db.literal(period),
+        amount_expr,
+        db.false()
+    )
+    stmt = dialect_insert(Fee).from_select(
+        ['user_id', 'month', 'period', 'amount_due', 'is_paid'], missing
+    ).on_conflict_do_nothing(
+        index_elements=['user_id', 'period']
+    ).returning(Fee.id, Fee.user_id)
+    inserted = db.session.execute(stmt).all()
+    user_ids = [row.user_id for row in inserted]
+
+    if len(user_ids) != sum(row.missing for row in class_counts):
+        # Another request assigned some of the same dues meanwhile; count what we actually inserted
+        for counts in by_class.values():
+            counts['added'] = 0
+        for student_class, added in db.session.query(class_key, db.func.count(Fee.id)).outerjoin(
+            Profile, Profile.user_id == Fee.user_id
+        ).filter(Fee.id.in_([row.id for row in inserted])).group_by(class_key):
+            by_class.setdefault(student_class, {'students': 0, 'added': 0})['added'] = added
+
+    if user_ids:
+        db.session.execute(db.insert(Notification), [
+            {'user_id': user_id, 'message': notification_message, 'kind': 'fee_due'} for user_id in user_ids
+        ])
+        count_new_notification(user_ids=user_ids)
+        refresh_student_balances(user_ids)
+
+    return {
+        'added': len(user_ids),
+        'skipped': total_students - len(user_ids),
+        'total_students': total_students,
+        'user_ids': user_ids,
+        'by_class': by_class
+    }
+
+def _parse_paid_flag(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or str(value).strip() == '':
+        return False
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'y', 'paid', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'n', 'unpaid', 'off'):
+        return False
+    raise ValueError('paid must be yes/no')
+
+def bulk_upsert_dues(rows, dry_run=False, update_existing=True):
+    """
+    Insert or update many dues at once.
+
+    Each row is a dict with 'user_id' or 'reg_no', 'month' (label or YYYY-MM), 'amount'
+    and optional 'paid'. Rows are validated up front, students are resolved with one
+    lookup, existing fees with one more, and all writes go out as a single
+    INSERT ... ON CONFLICT (user_id, period) statement. With update_existing=False
+    existing dues are reported as skipped instead of being overwritten. With
+    dry_run=True nothing is written.
+
+    Returns {'inserted': n, 'updated': n, 'skipped': n, 'invalid': n, 'results': [...]} where results
+    has one {'row': index, 'status': 'inserted'|'updated'|'skipped'|'invalid', ...}
+    entry per input row.
+    """
+    results = []
+    parsed = []
+    for index, row in enumerate(rows):
+        result = {'row': index, 'status': 'invalid'}
+        results.append(result)
         try:
-            locked_amount = int(monthly_due_setting.value) if monthly_due_setting and monthly_due_setting.value.isdigit() else 1500
-        except Exception:
-            locked_amount = 1500
-        current_app.logger.info(f'Setting locked amount for {current_month_label}: ₹{locked_amount}')
-    
-    # Get all non-admin users
-    users = User.query.filter_by(is_admin=False).all()
-    total_new_dues = 0
-    
-    for user in users:
-        # Check if due already exists for this month
-        existing_due = Fee.query.filter_by(user_id=user.id, month=current_month_label).first()
-        
-        if not existing_due:
-            # Create due for current month with the locked amount
-            fee = Fee(user_id=user.id, month=current_month_label, amount_due=locked_amount, is_paid=False)
-            db.session.add(fee)
-            total_new_dues += 1
-    
-    if total_new_dues > 0:
-        # Send notifications to all students about the new dues
-        notification_message = f"{current_month_label} month due added - ₹{locked_amount}. Please pay your dues on time."
-        
-        for user in users:
-            # Create notification for each student
-            notification = Notification(
-                user_id=user.id,
-                message=notification_message
-            )
-            db.session.add(notification)
-            
-            # Send real-time notification via SocketIO
-            try:
-                socketio.emit('fee_notification', {
-                    'message': notification_message,
-                    'url': url_for('student.fee'),
-                    'button': 'View Dues'
-                }, room=f'student_{user.id}')
-            except Exception as e:
-                current_app.logger.error(f'Error sending real-time notification to student {user.id}: {str(e)}')
-        
-        db.session.commit()
-        current_app.logger.info(f'Assigned {total_new_dues} new monthly dues for {current_month_label} at locked amount ₹{locked_amount} and sent notifications to {len(users)} students')
-    
-    return total_new_dues
+            user_id = str(row.get('user_id') or '').strip()
+            reg_no = str(row.get('reg_no') or '').strip()
+            if not user_id and not reg_no:
+                raise ValueError('user_id or reg_no is required')
+            period = month_label_to_period(str(row.get('month') or ''))
+            if not period:
+                raise ValueError('month must look like "July 2025" or "2025-07"')
+            amount = int(str(row.get('amount', '')).strip())
+            if amount < 0:
+                raise ValueError('amount must not be negative')
+            paid = _parse_paid_flag(row.get('paid'))
+            parsed.append((result, int(user_id) if user_id else None, reg_no or None, period, amount, paid))
+        except (TypeError, ValueError, AttributeError) as e:
+            result['reason'] = str(e) if not isinstance(e, AttributeError) else 'row must be an object'
+
+    # Resolve students by user id or registration number in one lookup
+    user_ids = {entry[1] for entry in parsed if entry[1] is not None}
+    reg_nos = {entry[2] for entry in parsed if entry[1] is None}
+    by_user_id, by_reg_no = set(), {}
+    if user_ids or reg_nos:
+        for profile_user_id, profile_reg_no in db.session.query(Profile.user_id, Profile.reg_no).filter(
+            db.or_(Profile.user_id.in_(user_ids), Profile.reg_no.in_(reg_nos))
+        ):
+            by_user_id.add(profile_user_id)
+            by_reg_no[profile_reg_no] = profile_user_id
+
+    resolved = {}
+    for result, user_id, reg_no, period, amount, paid in parsed:
+        if user_id is not None:
+            student_id = user_id if user_id in by_user_id else None
+        else:
+            student_id = by_reg_no.get(reg_no)
+        if student_id is None:
+            result['reason'] = 'student not found'
+            continue
+        result['user_id'] = student_id
+        if (student_id, period) in resolved:
+            # The last row for a student and month wins
+            earlier = resolved[(student_id, period)][0]
+            earlier['status'], earlier['reason'] = 'skipped', 'superseded by a later row'
+        resolved[(student_id, period)] = (result, amount, paid)
+
+    existing = {}
+    if resolved:
+        for fee in db.session.query(Fee.id, Fee.user_id, Fee.period, Fee.month, Fee.amount_due, Fee.is_paid).filter(
+            Fee.user_id.in_({key[0] for key in resolved}),
+            Fee.period.in_({key[1] for key in resolved})
+        ):
+            existing[(fee.user_id, fee.period)] = fee
+
+    values = []
+    for (student_id, period), (result, amount, paid) in resolved.items():
+        current = existing.get((student_id, period))
+        if current is None:
+            result['status'] = 'inserted'
+            month = period.strftime('%B %Y')
+        elif not update_existing:
+            result['status'], result['reason'] = 'skipped', 'due already exists'
+            continue
+        elif current.amount_due == amount and bool(current.is_paid) == paid:
+            result['status'], result['reason'] = 'skipped', 'unchanged'
+            continue
+        else:
+            result['status'] = 'updated'
+            month = current.month  # the stored label is kept; only amount and paid are updated
+        result['month'] = month
+        values.append({'user_id': student_id, 'month': month, 'period': period, 'amount_due': amount, 'is_paid': paid})
+
+    if values and not dry_run:
+        stmt = dialect_insert(Fee).values(values)
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'period'], set_={
+            'amount_due': stmt.excluded.amount_due,
+            'is_paid': stmt.excluded.is_paid
+        })
+        db.session.execute(stmt)
+        refresh_student_balances({value['user_id'] for value in values})
+
+    counts = {status: sum(1 for result in results if result['status'] == status) for status in ('inserted', 'updated', 'skipped', 'invalid')}
+    return {
+        'inserted': counts['inserted'],
+        'updated': counts['updated'],
+        'skipped': counts['skipped'],
+        'invalid': counts['invalid'],
+        'dry_run': dry_run,
+        'results': results
+    }
+
+def record_payment_events(event_type, payment_ids, actor_id=None):
+    """
+    Append one payment_events row per payment with a single INSERT ... SELECT.
+
+    The student, fee, method and fee amount are copied from the payment, so the ledger
+    stays readable if the payment or fee is later removed. Called in the same
+    transaction as the state change it records; the caller commits.
+    """
+    if not payment_ids:
+        return
+    rows = db.select(
+        Payment.id, Payment.user_id, Payment.fee_id, db.literal(event_type), Payment.method, Fee.amount_due,
+        db.literal(actor_id, db.Integer), db.literal(get_current_time_ist(), db.DateTime)
+    ).outerjoin(Fee, Fee.id == Payment.fee_id).where(Payment.id.in_(payment_ids), Payment.user_id.is_not(None))
+    db.session.execute(db.insert(PaymentEvent).from_select(
+        ['payment_id', 'user_id', 'fee_id', 'event_type', 'method', 'amount', 'actor_id', 'created_at'], rows
+    ))
+
+def detach_payment_events(user_id):
+    """
+    Keep a removed student's payment_events rows in the ledger. Their student, payment,
+    fee and actor references are cleared before those rows are deleted; the database
+    does the same through ON DELETE SET NULL, but not every backend enforces it.
+    The caller commits.
+    """
+    db.session.execute(db.update(PaymentEvent).where(PaymentEvent.user_id == user_id).values(
+        user_id=None, payment_id=None, fee_id=None
+    ))
+    db.session.execute(db.update(PaymentEvent).where(PaymentEvent.actor_id == user_id).values(actor_id=None))
+
+def get_payment_timeline(user_id, limit=50):
+    """Most recent payment events for one student, newest first (served by the (user_id, created_at) index)"""
+    return db.session.query(
+        PaymentEvent.event_type, PaymentEvent.method, PaymentEvent.amount, PaymentEvent.created_at, Fee.month
+    ).outerjoin(Fee, Fee.id == PaymentEvent.fee_id).filter(PaymentEvent.user_id == user_id).order_by(
+        PaymentEvent.created_at.desc(), PaymentEvent.id.desc()
+    ).limit(limit).all()
+
+def _rejected(payment_id):
+    """EXISTS clause: the payment has a rejected event"""
+    return db.exists().where(PaymentEvent.payment_id == payment_id, PaymentEvent.event_type == 'rejected')
+
+def find_duplicate_reference(reference):
+    """Return the id of a payment (not rejected) already carrying this UPI reference after normalization, or None"""
+    normalized = normalize_payment_reference(reference)
+    if not normalized:
+        return None
+    return db.session.query(Payment.id).filter(
+        Payment.reference_normalized == normalized, ~_rejected(Payment.id)
+    ).limit(1).scalar()
+
+def get_approval_queue(recent_limit=10):
+    """
+    Load the payment approvals dashboard with two statements.
+
+    One query selects only the displayed columns of every pending payment plus the
+    `recent_limit` most recently confirmed ones, joined to their fee and profile, and
+    flags references shared with another payment through the reference index. One
+    aggregate returns the pending counts per method and, from the payment_events
+    (event_type, created_at) index, the approvals and rejections since midnight IST.
+    """
+    recent_ids = db.select(Payment.id).filter(Payment.is_confirmed == True).order_by(
+        Payment.confirmed_at.desc().nulls_last(), Payment.id.desc()
+    ).limit(recent_limit).scalar_subquery()
+    other = db.aliased(Payment)
+    rows = db.session.query(
+        Payment.id, Payment.method, Payment.reference, Payment.is_confirmed,
+        Payment.requested_at, Payment.confirmed_at,
+        Fee.month, Fee.amount_due,
+        Profile.full_name, Profile.roll_number, Profile.student_class, Profile.profile_pic,
+        db.exists().where(
+            other.reference_normalized == Payment.reference_normalized, other.id != Payment.id,
+            ~_rejected(other.id)
+        ).label('is_duplicate'),
+        _rejected(Payment.id).label('is_rejected')
+    ).join(Fee, Fee.id == Payment.fee_id).join(Profile, Profile.user_id == Payment.user_id).filter(
+        db.or_(Payment.is_confirmed == False, Payment.id.in_(recent_ids))
+    ).order_by(Payment.requested_at.desc()).all()
+
+    start_of_day = get_current_time_ist().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    pending = Payment.is_confirmed == False
+
+    def events_today(event_type):
+        return db.select(db.func.count(PaymentEvent.id)).where(
+            PaymentEvent.event_type == event_type, PaymentEvent.created_at >= start_of_day
+        ).scalar_subquery()
+
+    stats = db.session.query(
+        db.func.count(Payment.id).filter(pending, Payment.method == 'Cash').label('pending_cash'),
+        db.func.count(Payment.id).filter(pending, Payment.method == 'UPI').label('pending_upi'),
+        events_today('approved').label('approved_today'),
+        events_today('rejected').label('rejected_today')
+    ).one()
+
+    recent_approvals = sorted(
+        (row for row in rows if row.is_confirmed),
+        key=lambda row: (row.confirmed_at or row.requested_at, row.id), reverse=True
+    )
+    return {
+        'pending_cash_payments': [row for row in rows if not row.is_confirmed and row.method == 'Cash'],
+        'pending_upi_payments': [row for row in rows if not row.is_confirmed and row.method == 'UPI'],
+        'recent_approvals': recent_approvals,
+        'pending_cash_count': stats.pending_cash,
+        'pending_upi_count': stats.pending_upi,
+        'approved_today': stats.approved_today,
+        'rejected_today': stats.rejected_today
+    }
+
+def process_payments(payment_ids, action, actor_id=None):
+    """
+    Approve or reject many pending payments at once.
+
+    Pending payments among `payment_ids` are marked processed with one UPDATE ...
+    RETURNING on payments; on approval their fees are then marked paid with one UPDATE
+    on fees and the affected balances are refreshed; one payment event is appended per
+    processed payment. Ids that are unknown or already processed are reported as
+    skipped. The caller commits.
+    """
+    requested = sorted(set(payment_ids))
+    processed = db.session.execute(
+        db.update(Payment).where(
+            Payment.id.in_(requested), Payment.is_confirmed == False
+        ).values(is_confirmed=True, confirmed_at=get_current_time_ist()).returning(
+            Payment.id, Payment.fee_id, Payment.method
+        ).execution_options(synchronize_session=False)
+    ).all()
+
+    if action == 'approve' and processed:
+        user_ids = db.session.execute(
+            db.update(Fee).where(
+                Fee.id.in_({row.fee_id for row in processed})
+            ).values(is_paid=True).returning(Fee.user_id).execution_options(synchronize_session=False)
+        ).scalars().all()
+        refresh_student_balances(set(user_ids))
+    else:
+        invalidate_on_commit(FEE_SUMMARY_CACHE_PREFIX)
+
+    processed_ids = {row.id for row in processed}
+    record_payment_events('approved' if action == 'approve' else 'rejected', processed_ids, actor_id)
+    adjust_pending_approvals(-len(processed_ids))
+    return {
+        'action': action,
+        'processed': sorted(processed_ids),
+        'skipped': [payment_id for payment_id in requested if payment_id not in processed_ids],
+        'by_method': {
+            method: sum(1 for row in processed if row.method == method)
+            for method in {row.method for row in processed}
+        }
+    }
+
+def get_class_fee_amounts():
+    """{student_class: monthly amount} for every class in the fee table"""
+    from app.forms import class_choices
+    return {value: get_fee_amount_for_class(value) for value, _ in class_choices if value != 'all'}
+
+def assign_monthly_dues(dry_run=False):
+    """
+    Assign the current month's dues to every student with a profile, at their class's
+    fee (see get_fee_amount_for_class), and notify the students who received a new due.
+
+    This is the same path as the admin's "Assign Monthly Dues" button; the scheduler
+    calls it once a month. Returns the bulk_assign_dues() result (added/skipped counts
+    and a per-class breakdown).
+    """
+    current_month_label = get_current_time_ist().strftime('%B %Y')
+    notification_message = f"{current_month_label} month due added. Please complete the due"
+    result = bulk_assign_dues(current_month_label, get_class_fee_amounts(), notification_message, dry_run=dry_run)
+    if dry_run:
+        return result
+    db.session.commit()
+
+    if result['user_ids']:
+        # One emit addressed to every affected student's room
+        try:
+            live_emit('fee_notification', {
+                'message': notification_message,
+                'url': url_for('student.fee'),
+                'button': 'View Dues'
+            }, to=[user_room(user_id) for user_id in result['user_ids']])
+        except Exception as e:
+            current_app.logger.error(f'Error sending real-time dues notification: {str(e)}')
+
+    current_app.logger.info(f'Assigned {result["added"]} new monthly dues for {current_month_label} (skipped {result["skipped"]})')
+    return result
 
 # Token helpers
 
@@ -261,36 +1190,52 @@ def sanitize_filename(filename):
         filename = 'file_' + filename
     return filename
 
+LEADERBOARD_CACHE_PREFIX = 'leaderboard:'
+
+def invalidate_leaderboard(student_class=None):
+    """Drop the cached leaderboard of a class (or of every class) when the transaction commits"""
+    invalidate_on_commit(f'{LEADERBOARD_CACHE_PREFIX}{student_class}' if student_class else LEADERBOARD_CACHE_PREFIX)
+
+def _build_leaderboard(student_class):
+    # Use a single query with joins and aggregation
+    leaderboard_data = db.session.query(
+        Profile.full_name,
+        Profile.roll_number,
+        db.func.coalesce(db.func.sum(Mark.marks_obtained), 0).label('total'),
+        db.func.count(Mark.id).label('total_tests')
+    ).filter(
+        Profile.student_class == student_class
+    ).outerjoin(
+        Mark, Profile.user_id == Mark.user_id
+    ).group_by(
+        Profile.id, Profile.full_name, Profile.roll_number
+    ).order_by(
+        db.func.coalesce(db.func.sum(Mark.marks_obtained), 0).desc()
+    ).all()
+
+    return [
+        {
+            'name': row.full_name,
+            'roll_number': row.roll_number,
+            'total': row.total,
+            'total_tests': row.total_tests
+        }
+        for row in leaderboard_data
+    ]
+
 def get_leaderboard_for_class(student_class):
     """
-    Get optimized leaderboard for a specific class
+    Get the leaderboard of a class.
+
+    Served from the cache for LEADERBOARD_CACHE_SECONDS and rebuilt on demand by a
+    single caller; mark and roster changes drop it through invalidate_leaderboard().
     """
     try:
-        # Use a single query with joins and aggregation
-        leaderboard_data = db.session.query(
-            Profile.full_name,
-            Profile.roll_number,
-            db.func.coalesce(db.func.sum(Mark.marks_obtained), 0).label('total'),
-            db.func.count(Mark.id).label('total_tests')
-        ).filter(
-            Profile.student_class == student_class
-        ).outerjoin(
-            Mark, Profile.user_id == Mark.user_id
-        ).group_by(
-            Profile.id, Profile.full_name, Profile.roll_number
-        ).order_by(
-            db.func.coalesce(db.func.sum(Mark.marks_obtained), 0).desc()
-        ).all()
-        
-        return [
-            {
-                'name': row.full_name,
-                'roll_number': row.roll_number,
-                'total': row.total,
-                'total_tests': row.total_tests
-            }
-            for row in leaderboard_data
-        ]
+        return cache.get_or_set(
+            f'{LEADERBOARD_CACHE_PREFIX}{student_class}',
+            lambda: _build_leaderboard(student_class),
+            current_app.config.get('LEADERBOARD_CACHE_SECONDS', 600)
+        )
     except Exception as e:
         current_app.logger.error(f'Error calculating leaderboard: {str(e)}')
         return []
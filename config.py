@@ -27,6 +27,46 @@ class Config:
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max file size
     UPLOAD_FOLDER = 'app/static/pdfs'
     ALLOWED_EXTENSIONS = {'pdf'}
+
+    # Pagination settings
+    FEEDUES_PAGE_SIZE = int(os.environ.get('FEEDUES_PAGE_SIZE', 50))
+    DUES_PAGE_SIZE = int(os.environ.get('DUES_PAGE_SIZE', 50))
+
+    # Bulk dues upload limit (rows per request)
+    BULK_DUES_MAX_ROWS = int(os.environ.get('BULK_DUES_MAX_ROWS', 5000))
+
+    # Scheduler settings: "<day of month> <HH:MM>" in IST, or "* <HH:MM>" for every day
+    MONTHLY_DUES_SCHEDULE = os.environ.get('MONTHLY_DUES_SCHEDULE', '1 06:00')
+    FEE_REMINDER_SCHEDULE = os.environ.get('FEE_REMINDER_SCHEDULE', '5 09:00')
+    NOTIFICATION_PURGE_SCHEDULE = os.environ.get('NOTIFICATION_PURGE_SCHEDULE', '* 03:00')
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'false').lower() in ['true', 'on', '1']
+    SCHEDULER_INTERVAL_SECONDS = int(os.environ.get('SCHEDULER_INTERVAL_SECONDS', 300))
+    # A run still 'running' after this long is assumed dead and may be claimed again
+    SCHEDULER_STALE_RUN_SECONDS = int(os.environ.get('SCHEDULER_STALE_RUN_SECONDS', 3600))
+
+    # Notifications older than this are hidden from the lists and removed by the purge job
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 15))
+    NOTIFICATION_PURGE_BATCH_SIZE = int(os.environ.get('NOTIFICATION_PURGE_BATCH_SIZE', 1000))
+    NOTIFICATIONS_PAGE_SIZE = int(os.environ.get('NOTIFICATIONS_PAGE_SIZE', 30))
+
+    # Cache settings (seconds)
+    FEE_SUMMARY_CACHE_SECONDS = int(os.environ.get('FEE_SUMMARY_CACHE_SECONDS', 30))
+    PENDING_APPROVALS_CACHE_SECONDS = int(os.environ.get('PENDING_APPROVALS_CACHE_SECONDS', 3600))
+    LEADERBOARD_CACHE_SECONDS = int(os.environ.get('LEADERBOARD_CACHE_SECONDS', 600))
+    UNREAD_NOTIFICATIONS_CACHE_SECONDS = int(os.environ.get('UNREAD_NOTIFICATIONS_CACHE_SECONDS', 3600))
+    # Optional shared cache for multi-worker deployments, e.g. redis://localhost:6379/0
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    
+    # Socket.IO settings for running several workers or instances, e.g. redis://localhost:6379/1.
+    # With a message queue, emits from any worker (or a CLI job) reach clients on every worker.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'excellence-socketio')
+    # Skip the long-polling handshake so a client never needs to hit the same worker twice
+    SOCKETIO_WEBSOCKET_ONLY = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'false').lower() in ['true', 'on', '1']
+    
+    # Outbound Socket.IO events are merged and delivered by a background task at this interval
+    OUTBOUND_FLUSH_SECONDS = float(os.environ.get('OUTBOUND_FLUSH_SECONDS', 0.25))
+    OUTBOUND_QUEUE_MAX_PENDING = int(os.environ.get('OUTBOUND_QUEUE_MAX_PENDING', 1000))
     
     # Security settings - No session timeout for uptime monitors
     PERMANENT_SESSION_LIFETIME = None  # No session timeout
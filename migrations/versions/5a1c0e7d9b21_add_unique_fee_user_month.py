@@ -0,0 +1,49 @@
+"""Add unique (user_id, month) constraint to fees
+
+Revision ID: 5a1c0e7d9b21
+Revises: 36e378e0d78d
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1c0e7d9b21'
+down_revision = '36e378e0d78d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse duplicate dues left behind by the old per-student existence checks.
+    # Payments are re-pointed to the oldest fee for the same student/month first.
+    op.execute(sa.text('''
+        UPDATE payments SET fee_id = (
+            SELECT MIN(f2.id) FROM fees f1
+            JOIN fees f2 ON f2.user_id = f1.user_id AND f2.month = f1.month
+            WHERE f1.id = payments.fee_id
+        )
+        WHERE fee_id IS NOT NULL
+    '''))
+    # Keep the month paid if any of its copies was paid
+    op.execute(sa.text('''
+        UPDATE fees SET is_paid = TRUE WHERE id IN (
+            SELECT MIN(id) FROM fees GROUP BY user_id, month
+            HAVING MAX(CASE WHEN is_paid THEN 1 ELSE 0 END) = 1
+        )
+    '''))
+    op.execute(sa.text('''
+        DELETE FROM fees WHERE id NOT IN (
+            SELECT MIN(id) FROM fees GROUP BY user_id, month
+        )
+    '''))
+
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_fee_user_month', ['user_id', 'month'])
+
+
+def downgrade():
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_fee_user_month', type_='unique')
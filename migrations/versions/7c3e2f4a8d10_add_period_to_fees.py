@@ -0,0 +1,52 @@
+"""Add period date column to fees
+
+Revision ID: 7c3e2f4a8d10
+Revises: 5a1c0e7d9b21
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e2f4a8d10'
+down_revision = '5a1c0e7d9b21'
+branch_labels = None
+depends_on = None
+
+
+def _label_to_period(label):
+    for fmt in ('%B %Y', '%b %Y', '%Y-%m'):
+        try:
+            return datetime.strptime(label.strip(), fmt).date().replace(day=1)
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def upgrade():
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('period', sa.Date(), nullable=True))
+
+    # Backfill from the existing labels, one UPDATE per distinct month
+    bind = op.get_bind()
+    labels = bind.execute(sa.text('SELECT DISTINCT month FROM fees')).scalars().all()
+    for label in labels:
+        period = _label_to_period(label)
+        if period is None:
+            continue
+        bind.execute(
+            sa.text('UPDATE fees SET period = :period WHERE month = :month'),
+            {'period': period, 'month': label}
+        )
+
+    op.create_index('idx_fee_user_period', 'fees', ['user_id', 'period'])
+
+
+def downgrade():
+    op.drop_index('idx_fee_user_period', 'fees')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_column('period')
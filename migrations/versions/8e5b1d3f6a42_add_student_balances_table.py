@@ -0,0 +1,45 @@
+"""Add student_balances summary table
+
+Revision ID: 8e5b1d3f6a42
+Revises: 7c3e2f4a8d10
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e5b1d3f6a42'
+down_revision = '7c3e2f4a8d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('student_balances',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('due_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total_due', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total_paid', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Seed one row per student from the existing fee history
+    op.execute(sa.text('''
+        INSERT INTO student_balances (user_id, due_count, total_due, total_paid, updated_at)
+        SELECT users.id,
+               COUNT(fees.id) FILTER (WHERE fees.is_paid IS NOT TRUE),
+               COALESCE(SUM(fees.amount_due) FILTER (WHERE fees.is_paid IS NOT TRUE), 0),
+               COALESCE(SUM(fees.amount_due) FILTER (WHERE fees.is_paid IS TRUE), 0),
+               CURRENT_TIMESTAMP
+        FROM users LEFT JOIN fees ON fees.user_id = users.id
+        WHERE users.is_admin IS FALSE
+        GROUP BY users.id
+    '''))
+
+
+def downgrade():
+    op.drop_table('student_balances')
@@ -0,0 +1,23 @@
+"""Add (period, id) index on fees for the dues listing
+
+Revision ID: 9b4d2a6c1e57
+Revises: 8e5b1d3f6a42
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4d2a6c1e57'
+down_revision = '8e5b1d3f6a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_fee_period_id', 'fees', ['period', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_fee_period_id', table_name='fees')
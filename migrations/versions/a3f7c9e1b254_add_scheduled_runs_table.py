@@ -0,0 +1,34 @@
+"""Add scheduled_runs table for idempotent scheduler jobs
+
+Revision ID: a3f7c9e1b254
+Revises: 9b4d2a6c1e57
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7c9e1b254'
+down_revision = '9b4d2a6c1e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduled_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job', sa.String(length=64), nullable=False),
+    sa.Column('period_key', sa.String(length=32), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False, server_default='running'),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('detail', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('job', 'period_key', name='uq_scheduled_run_job_period')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduled_runs')
@@ -0,0 +1,42 @@
+"""Keep payment_events rows when their student is removed
+
+Revision ID: a8e3c5d17f02
+Revises: f3d9b2c7e418
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e3c5d17f02'
+down_revision = 'f3d9b2c7e418'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The ledger is append-only: removing a student detaches their events instead of deleting them
+    with op.batch_alter_table('payment_events', schema=None) as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.drop_constraint('payment_events_user_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'payment_events_user_id_fkey',
+            'users',
+            ['user_id'], ['id'],
+            ondelete='SET NULL'
+        )
+
+
+def downgrade():
+    op.execute("DELETE FROM payment_events WHERE user_id IS NULL")
+    with op.batch_alter_table('payment_events', schema=None) as batch_op:
+        batch_op.drop_constraint('payment_events_user_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'payment_events_user_id_fkey',
+            'users',
+            ['user_id'], ['id'],
+            ondelete='CASCADE'
+        )
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
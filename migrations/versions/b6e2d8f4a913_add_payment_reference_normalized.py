@@ -0,0 +1,43 @@
+"""Add normalized, indexed UPI reference to payments
+
+Revision ID: b6e2d8f4a913
+Revises: a3f7c9e1b254
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d8f4a913'
+down_revision = 'a3f7c9e1b254'
+branch_labels = None
+depends_on = None
+
+
+def _normalize(reference):
+    return re.sub(r'[^0-9A-Z]', '', reference.upper()) or None
+
+
+def upgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reference_normalized', sa.String(length=100), nullable=True))
+
+    # Backfill from the existing references, one UPDATE per distinct value
+    bind = op.get_bind()
+    references = bind.execute(sa.text('SELECT DISTINCT reference FROM payments WHERE reference IS NOT NULL')).scalars().all()
+    for reference in references:
+        bind.execute(
+            sa.text('UPDATE payments SET reference_normalized = :normalized WHERE reference = :reference'),
+            {'normalized': _normalize(reference), 'reference': reference}
+        )
+
+    op.create_index('ix_payments_reference_normalized', 'payments', ['reference_normalized'])
+
+
+def downgrade():
+    op.drop_index('ix_payments_reference_normalized', 'payments')
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_column('reference_normalized')
@@ -0,0 +1,62 @@
+"""Add append-only payment_events ledger
+
+Revision ID: c9a4e6b2d785
+Revises: b6e2d8f4a913
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a4e6b2d785'
+down_revision = 'b6e2d8f4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('fee_id', sa.Integer(), nullable=True),
+    sa.Column('event_type', sa.String(length=20), nullable=False),
+    sa.Column('method', sa.String(length=20), nullable=True),
+    sa.Column('amount', sa.Integer(), nullable=True),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['fee_id'], ['fees.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['actor_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_payment_event_type_created', 'payment_events', ['event_type', 'created_at'])
+    op.create_index('idx_payment_event_user_created', 'payment_events', ['user_id', 'created_at'])
+    op.create_index('ix_payment_events_payment_id', 'payment_events', ['payment_id'])
+
+    # Seed the ledger from existing payments. Processed payments whose fee is paid count
+    # as approved; processed payments on an unpaid fee were rejected.
+    op.execute("""
+        INSERT INTO payment_events (payment_id, user_id, fee_id, event_type, method, amount, actor_id, created_at)
+        SELECT p.id, p.user_id, p.fee_id, 'requested', p.method, f.amount_due, p.user_id, COALESCE(p.requested_at, CURRENT_TIMESTAMP)
+        FROM payments p LEFT JOIN fees f ON f.id = p.fee_id
+        WHERE p.user_id IS NOT NULL
+    """)
+    op.execute("""
+        INSERT INTO payment_events (payment_id, user_id, fee_id, event_type, method, amount, actor_id, created_at)
+        SELECT p.id, p.user_id, p.fee_id,
+               CASE WHEN f.is_paid THEN 'approved' ELSE 'rejected' END,
+               p.method, f.amount_due, NULL, COALESCE(p.confirmed_at, p.requested_at, CURRENT_TIMESTAMP)
+        FROM payments p LEFT JOIN fees f ON f.id = p.fee_id
+        WHERE p.user_id IS NOT NULL AND p.is_confirmed
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_payment_events_payment_id', 'payment_events')
+    op.drop_index('idx_payment_event_user_created', 'payment_events')
+    op.drop_index('idx_payment_event_type_created', 'payment_events')
+    op.drop_table('payment_events')
@@ -0,0 +1,54 @@
+"""Add per-student notification_receipts and notification queue indexes
+
+Revision ID: d2b7f5a8c316
+Revises: c9a4e6b2d785
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7f5a8c316'
+down_revision = 'c9a4e6b2d785'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_receipts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('notification_id', sa.Integer(), nullable=False),
+    sa.Column('seen_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['notification_id'], ['notifications.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'notification_id')
+    )
+    op.create_index('ix_notification_receipts_notification_id', 'notification_receipts', ['notification_id'])
+    op.create_index('idx_notification_user_created', 'notifications', ['user_id', 'created_at'])
+    op.create_index('idx_notification_class_created', 'notifications', ['class_for', 'created_at'])
+
+    # Carry over the old global flag: personal notifications already seen by their student,
+    # and class-wide ones already seen (by someone) for every student they were addressed to,
+    # so nobody gets a backlog of old banners.
+    op.execute("""
+        INSERT INTO notification_receipts (user_id, notification_id, seen_at)
+        SELECT n.user_id, n.id, COALESCE(n.created_at, CURRENT_TIMESTAMP)
+        FROM notifications n
+        WHERE n.user_id IS NOT NULL AND n.seen
+    """)
+    op.execute("""
+        INSERT INTO notification_receipts (user_id, notification_id, seen_at)
+        SELECT p.user_id, n.id, COALESCE(n.created_at, CURRENT_TIMESTAMP)
+        FROM notifications n
+        JOIN profiles p ON n.class_for = 'all' OR n.class_for = p.student_class
+        WHERE n.user_id IS NULL AND n.seen AND p.user_id IS NOT NULL
+    """)
+
+
+def downgrade():
+    op.drop_index('idx_notification_class_created', 'notifications')
+    op.drop_index('idx_notification_user_created', 'notifications')
+    op.drop_index('ix_notification_receipts_notification_id', 'notification_receipts')
+    op.drop_table('notification_receipts')
@@ -0,0 +1,43 @@
+"""Add Notification.kind and ref_id with (user_id|class_for, kind, created_at) indexes
+
+Revision ID: e5c8a1f3b694
+Revises: d2b7f5a8c316
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c8a1f3b694'
+down_revision = 'd2b7f5a8c316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('kind', sa.String(length=20), nullable=False, server_default='general'))
+        batch_op.add_column(sa.Column('ref_id', sa.Integer(), nullable=True))
+
+    # Classify existing rows by the message templates the app has used for each kind
+    op.execute("UPDATE notifications SET kind = 'pdf' WHERE message LIKE '📄%'")
+    op.execute("UPDATE notifications SET kind = 'test' WHERE message LIKE '📝%'")
+    op.execute("""
+        UPDATE notifications SET kind = 'resource'
+        WHERE message LIKE '📚%' OR message = 'New learning resource is available now'
+    """)
+    op.execute("UPDATE notifications SET kind = 'fee_due' WHERE user_id IS NOT NULL AND message LIKE '% month due added%'")
+    op.execute("UPDATE notifications SET kind = 'fee_reminder' WHERE user_id IS NOT NULL AND message LIKE 'Fee due for %'")
+
+    op.create_index('idx_notification_user_kind_created', 'notifications', ['user_id', 'kind', 'created_at'])
+    op.create_index('idx_notification_class_kind_created', 'notifications', ['class_for', 'kind', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('idx_notification_class_kind_created', 'notifications')
+    op.drop_index('idx_notification_user_kind_created', 'notifications')
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_column('ref_id')
+        batch_op.drop_column('kind')
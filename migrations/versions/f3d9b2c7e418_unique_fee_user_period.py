@@ -0,0 +1,53 @@
+"""Enforce one due per student per month on (user_id, period) instead of the month label
+
+Revision ID: f3d9b2c7e418
+Revises: e5c8a1f3b694
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3d9b2c7e418'
+down_revision = 'e5c8a1f3b694'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse dues stored under different labels for the same month ("Jul 2025" and
+    # "July 2025"): keep the oldest, carry over the paid flag, re-point references.
+    op.execute(sa.text('''
+        UPDATE fees SET is_paid = TRUE WHERE id IN (
+            SELECT MIN(id) FROM fees WHERE period IS NOT NULL GROUP BY user_id, period
+            HAVING MAX(CASE WHEN is_paid THEN 1 ELSE 0 END) = 1
+        )
+    '''))
+    for table in ('payments', 'payment_events'):
+        op.execute(sa.text(f'''
+            UPDATE {table} SET fee_id = (
+                SELECT MIN(f2.id) FROM fees f1
+                JOIN fees f2 ON f2.user_id = f1.user_id AND f2.period = f1.period
+                WHERE f1.id = {table}.fee_id
+            )
+            WHERE fee_id IN (SELECT id FROM fees WHERE period IS NOT NULL)
+        '''))
+    op.execute(sa.text('''
+        DELETE FROM fees WHERE period IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM fees WHERE period IS NOT NULL GROUP BY user_id, period
+        )
+    '''))
+
+    op.drop_index('idx_fee_user_period', 'fees')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_fee_user_month', type_='unique')
+        batch_op.create_unique_constraint('uq_fee_user_period', ['user_id', 'period'])
+
+
+def downgrade():
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_fee_user_period', type_='unique')
+        batch_op.create_unique_constraint('uq_fee_user_month', ['user_id', 'month'])
+    op.create_index('idx_fee_user_period', 'fees', ['user_id', 'period'])
@@ -2,5 +2,13 @@ from app import create_app, socketio
 
 app = create_app()
 
+# Deliver Socket.IO events from a background task instead of inside requests
+from app.events import outbound
+outbound.start()
+
+if app.config.get('SCHEDULER_ENABLED'):
+    from app.scheduler import start_scheduler
+    start_scheduler(app)
+
 if __name__ == "__main__":
     socketio.run(app, debug=True, port=5001)
\ No newline at end of file
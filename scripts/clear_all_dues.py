@@ -24,7 +24,7 @@ def clear_all_dues():
             
             # Find notifications related to dues
             due_notifications = Notification.query.filter(
-                Notification.message.like('%month due added%')
+                Notification.kind == 'fee_due'
             ).count()
             
             print(f"Found {fee_count} dues, {payment_count} payments, and {due_notifications} due-related notifications")
@@ -50,7 +50,7 @@ def clear_all_dues():
             
             # Delete due-related notifications
             deleted_notifications = Notification.query.filter(
-                Notification.message.like('%month due added%')
+                Notification.kind == 'fee_due'
             ).delete(synchronize_session=False)
             print(f"Deleted {deleted_notifications} due-related notifications")
             